@@ -15,21 +15,87 @@ Funcionalidades:
 import pandas as pd
 import psycopg2
 from sqlalchemy import create_engine, text
+from concurrent.futures import ThreadPoolExecutor
+import io
 import os
+import re
+import subprocess
 from datetime import datetime
 import logging
 import warnings
 warnings.filterwarnings('ignore')
 
+# Arrow opcional: resultados columnares y COPY binario (Arrow → PostgreSQL)
+try:
+    import pyarrow as pa
+    ARROW_AVAILABLE = True
+except ImportError:
+    ARROW_AVAILABLE = False
+
+try:
+    from pgpq import ArrowToPostgresBinaryEncoder
+    BINARY_COPY_AVAILABLE = ARROW_AVAILABLE
+except ImportError:
+    BINARY_COPY_AVAILABLE = False
+
 # Configuración de logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Engines compartidos por cadena de conexión (un solo pool por proceso)
+_engines = {}
+
+def get_engine(connection_string):
+    """
+    Obtener el engine de SQLAlchemy para una cadena de conexión
+    
+    Args:
+        connection_string (str): URL de conexión a PostgreSQL
+        
+    Returns:
+        Engine: Engine compartido con pool de conexiones
+    """
+    if connection_string not in _engines:
+        _engines[connection_string] = create_engine(
+            connection_string,
+            echo=False,
+            pool_size=8,
+            max_overflow=4,
+            pool_pre_ping=True,
+            pool_recycle=3600
+        )
+    return _engines[connection_string]
+
 class DatabaseManager:
     """
     Gestor principal de la base de datos PostgreSQL
     """
     
+    # Tablas cuyo CSV se carga tal cual, sin conversiones en pandas
+    _NO_TRANSFORM_TABLES = {'categorias', 'proveedores', 'ubicaciones'}
+    
+    # Tablas con columnas tipadas que se cargan con COPY binario si está disponible
+    _BINARY_COPY_TABLES = {'inventario'}
+    
+    # Tablas grandes que se cargan a través de una tabla temporal (sin WAL)
+    _STAGED_TABLES = {'inventario', 'movimientos_inventario'}
+    
+    # Vistas materializadas que dependen de inventario
+    _MATERIALIZED_VIEWS = ['mv_kpis_principales', 'mv_rentabilidad_categoria', 'mv_inventario_enriquecido']
+    
+    # Filas por bloque al leer CSV grandes
+    _CSV_CHUNKSIZE = 50000
+    
+    # Columnas de fecha y booleanas por tabla
+    _DATE_COLUMNS = {
+        'inventario': ['fecha_ultima_compra', 'fecha_ultima_venta', 'fecha_creacion'],
+        'movimientos_inventario': ['fecha_movimiento'],
+        'alertas': ['fecha_generacion', 'fecha_resolucion']
+    }
+    _BOOL_COLUMNS = {
+        'inventario': ['requiere_refrigeracion', 'es_peligroso', 'activo']
+    }
+    
     def __init__(self, config=None):
         """
         Inicializar el gestor de base de datos
@@ -69,12 +135,12 @@ class DatabaseManager:
                 f"?sslmode={self.config['sslmode']}"
             )
             
-            # Crear engine de SQLAlchemy
-            self.engine = create_engine(connection_string, echo=False)
+            # Engine de SQLAlchemy compartido a nivel de módulo
+            self.engine = get_engine(connection_string)
             
             # Probar conexión
             with self.engine.connect() as conn:
-                result = conn.execute(text("SELECT 1"))
+                conn.exec_driver_sql("SELECT 1")
                 logger.info("✅ Conexión a PostgreSQL establecida exitosamente")
                 return True
                 
@@ -87,6 +153,7 @@ class DatabaseManager:
         Cerrar conexión con la base de datos
         """
         if self.engine:
+            # Cierra las conexiones del pool; el engine sigue disponible para reutilizarse
             self.engine.dispose()
             logger.info("🔌 Conexión cerrada")
     
@@ -94,37 +161,79 @@ class DatabaseManager:
         """
         Crear todas las tablas del schema si no existen
         
+        Los índices secundarios se crean aparte con create_indexes()
+        después de la carga masiva de datos.
+        
         Returns:
             bool: True si las tablas fueron creadas exitosamente
         """
+        if self._execute_sql_file('sql/schema_completo.sql'):
+            logger.info("✅ Schema de base de datos creado/actualizado")
+            return True
+        return False
+    
+    def create_indexes(self):
+        """
+        Crear los índices de sql/indexes.sql (después de cargar datos)
+        
+        Returns:
+            bool: True si los índices fueron creados exitosamente
+        """
+        if self._execute_sql_file('sql/indexes.sql'):
+            logger.info("✅ Índices creados")
+            return True
+        return False
+    
+    def drop_indexes(self):
+        """
+        Eliminar los índices de sql/indexes.sql antes de una recarga masiva
+        
+        Returns:
+            bool: True si los índices fueron eliminados exitosamente
+        """
         try:
-            # Leer schema SQL
-            with open('sql/schema_completo.sql', 'r', encoding='utf-8') as file:
-                schema_sql = file.read()
+            with open('sql/indexes.sql', 'r', encoding='utf-8') as file:
+                index_names = re.findall(r'CREATE INDEX IF NOT EXISTS (\w+)', file.read())
             
-            # Ejecutar schema
-            with self.engine.connect() as conn:
-                # Dividir por comandos individuales
-                commands = schema_sql.split(';')
-                
-                for command in commands:
-                    command = command.strip()
-                    if command and not command.startswith('--'):
-                        try:
-                            conn.execute(text(command))
-                            conn.commit()
-                        except Exception as cmd_error:
-                            # Log error pero continuar (puede ser que la tabla ya exista)
-                            logger.warning(f"⚠️ Comando SQL: {cmd_error}")
-                
-                logger.info("✅ Schema de base de datos creado/actualizado")
-                return True
+            if index_names:
+                with self.engine.begin() as conn:
+                    conn.exec_driver_sql(f"DROP INDEX IF EXISTS {', '.join(index_names)}")
+            
+            logger.info(f"🗑️ {len(index_names)} índices eliminados para la carga masiva")
+            return True
+            
+        except FileNotFoundError:
+            logger.error("❌ Archivo indexes.sql no encontrado")
+            return False
+        except Exception as e:
+            logger.error(f"❌ Error eliminando índices: {e}")
+            return False
+    
+    def _execute_sql_file(self, file_path):
+        """
+        Ejecutar un script SQL completo en una sola transacción
+        
+        Args:
+            file_path (str): Ruta del script SQL (idempotente)
+            
+        Returns:
+            bool: True si el script se ejecutó exitosamente
+        """
+        try:
+            with open(file_path, 'r', encoding='utf-8') as file:
+                sql_script = file.read()
+            
+            # Un solo envío: el script es idempotente (IF NOT EXISTS / OR REPLACE)
+            with self.engine.begin() as conn:
+                conn.exec_driver_sql(sql_script)
+            
+            return True
                 
         except FileNotFoundError:
-            logger.error("❌ Archivo schema_completo.sql no encontrado")
+            logger.error(f"❌ Archivo {os.path.basename(file_path)} no encontrado")
             return False
         except Exception as e:
-            logger.error(f"❌ Error creando tablas: {e}")
+            logger.error(f"❌ Error ejecutando {os.path.basename(file_path)}: {e}")
             return False
     
     def load_csv_data(self, force_reload=False):
@@ -152,15 +261,21 @@ class DatabaseManager:
             }
             
             for table_name, file_path in csv_files.items():
-                if os.path.exists(file_path):
-                    self._load_table_from_csv(table_name, file_path, force_reload)
-                else:
+                if not os.path.exists(file_path):
                     logger.warning(f"⚠️ Archivo no encontrado: {file_path}")
             
-            # Cargar archivos opcionales
-            for table_name, file_path in optional_files.items():
-                if os.path.exists(file_path):
-                    self._load_table_from_csv(table_name, file_path, force_reload)
+            # Tablas con CSV disponible (los opcionales solo si existen), en orden de llaves foráneas
+            tables = [
+                (table_name, file_path)
+                for table_name, file_path in {**csv_files, **optional_files}.items()
+                if os.path.exists(file_path)
+            ]
+            
+            if force_reload and self.engine.dialect.name == 'postgresql':
+                return self._reload_tables(tables)
+            
+            for table_name, file_path in tables:
+                self._load_table_from_csv(table_name, file_path, force_reload)
             
             logger.info("✅ Datos CSV cargados exitosamente")
             return True
@@ -169,6 +284,88 @@ class DatabaseManager:
             logger.error(f"❌ Error cargando datos CSV: {e}")
             return False
     
+    def _reload_tables(self, tables):
+        """
+        Recargar desde CSV todas las tablas indicadas en una sola transacción
+        
+        Se vacían exactamente las tablas que se recargan (sin CASCADE): si otra
+        tabla que no se recarga (p. ej. ordenes_compra) las referencia, el
+        TRUNCATE falla y no se pierde ningún dato.
+        
+        Args:
+            tables (list): Pares (tabla, archivo CSV) en orden de llaves foráneas
+            
+        Returns:
+            bool: True si la recarga completa fue confirmada
+        """
+        raw = self.engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            table_list = ', '.join(table_name for table_name, _ in tables)
+            cursor.execute(f"TRUNCATE {table_list} RESTRICT")
+            
+            for table_name, file_path in tables:
+                rows = self._copy_csv(raw, table_name, file_path)
+                logger.info(f"✅ {table_name}: {rows} registros cargados desde {file_path}")
+            
+            raw.commit()
+        except Exception as e:
+            raw.rollback()
+            logger.error(f"❌ Error recargando datos CSV (sin cambios en la BD): {e}")
+            return False
+        finally:
+            raw.close()
+        
+        self.refresh_materialized_views()
+        logger.info("✅ Datos CSV recargados exitosamente")
+        return True
+    
+    def _read_csv_chunks(self, table_name, file_path):
+        """
+        Leer un CSV por bloques: la memoria queda acotada a un bloque
+        (las fechas se parsean durante la lectura)
+        
+        Args:
+            table_name (str): Nombre de la tabla
+            file_path (str): Ruta del archivo CSV
+            
+        Returns:
+            TextFileReader: Iterador de DataFrames de hasta _CSV_CHUNKSIZE filas
+        """
+        header = pd.read_csv(file_path, nrows=0).columns
+        date_columns = [col for col in self._DATE_COLUMNS.get(table_name, []) if col in header]
+        return pd.read_csv(file_path, parse_dates=date_columns, chunksize=self._CSV_CHUNKSIZE)
+    
+    def _copy_csv(self, raw, table_name, file_path):
+        """
+        Cargar un CSV con COPY sobre una conexión psycopg2 ya abierta
+        
+        Args:
+            raw: Conexión psycopg2; confirmar o revertir queda a cargo de quien llama
+            table_name (str): Nombre de la tabla
+            file_path (str): Ruta del archivo CSV
+            
+        Returns:
+            int: Número de registros cargados
+        """
+        # Tablas sin conversiones: enviar el archivo directo a COPY
+        if table_name in self._NO_TRANSFORM_TABLES:
+            return self._copy_file(file_path, table_name, raw=raw)
+        
+        total_rows = 0
+        for chunk in self._read_csv_chunks(table_name, file_path):
+            # Convertir tipos de datos según la tabla
+            chunk = self._convert_data_types(chunk, table_name)
+            
+            if BINARY_COPY_AVAILABLE and table_name in self._BINARY_COPY_TABLES:
+                self._copy_dataframe_binary(chunk, table_name, raw=raw)
+            else:
+                self._copy_dataframe(chunk, table_name, raw=raw)
+            
+            total_rows += len(chunk)
+        
+        return total_rows
+    
     def _load_table_from_csv(self, table_name, file_path, force_reload=False):
         """
         Cargar una tabla específica desde CSV
@@ -176,39 +373,223 @@ class DatabaseManager:
         Args:
             table_name (str): Nombre de la tabla
             file_path (str): Ruta del archivo CSV
-            force_reload (bool): Forzar recarga
+            force_reload (bool): Forzar recarga (en PostgreSQL la recarga
+                completa se hace con _reload_tables)
         """
         try:
-            # Verificar si la tabla ya tiene datos
+            # Verificar si la tabla ya tiene datos (se detiene en la primera fila)
             with self.engine.connect() as conn:
-                result = conn.execute(text(f"SELECT COUNT(*) FROM {table_name}"))
-                count = result.scalar()
+                result = conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {table_name} LIMIT 1)"))
+                has_rows = result.scalar()
                 
-                if count > 0 and not force_reload:
-                    logger.info(f"📊 Tabla {table_name} ya tiene datos ({count} registros)")
+                if has_rows and not force_reload:
+                    logger.info(f"📊 Tabla {table_name} ya tiene datos ({self._estimate_rows(conn, table_name)} registros)")
                     return
             
-            # Leer CSV
-            df = pd.read_csv(file_path)
+            # Todos los bloques van en una sola transacción:
+            # si un bloque falla no queda una tabla cargada a medias
+            if self.engine.dialect.name == 'postgresql':
+                raw = self.engine.raw_connection()
+                try:
+                    total_rows = self._copy_csv(raw, table_name, file_path)
+                    raw.commit()
+                except Exception:
+                    raw.rollback()
+                    raise
+                finally:
+                    raw.close()
+            else:
+                # Otros motores: INSERT por bloques dentro de una transacción
+                with self.engine.begin() as conn:
+                    total_rows = 0
+                    for chunk_number, chunk in enumerate(self._read_csv_chunks(table_name, file_path)):
+                        chunk = self._convert_data_types(chunk, table_name)
+                        chunk.to_sql(
+                            table_name, 
+                            conn, 
+                            if_exists='replace' if chunk_number == 0 else 'append',
+                            index=False,
+                            method='multi',
+                            chunksize=1000
+                        )
+                        total_rows += len(chunk)
             
-            # Convertir tipos de datos según la tabla
-            df = self._convert_data_types(df, table_name)
-            
-            # Cargar a la base de datos
-            df.to_sql(
-                table_name, 
-                self.engine, 
-                if_exists='replace',
-                index=False,
-                method='multi',
-                chunksize=1000
-            )
+            logger.info(f"✅ {table_name}: {total_rows} registros cargados desde {file_path}")
             
-            logger.info(f"✅ {table_name}: {len(df)} registros cargados desde {file_path}")
+            if table_name == 'inventario' and self.engine.dialect.name == 'postgresql':
+                self.refresh_materialized_views()
             
         except Exception as e:
             logger.error(f"❌ Error cargando {table_name}: {e}")
     
+    def refresh_materialized_views(self):
+        """
+        Refrescar las vistas materializadas de KPIs sin bloquear lecturas
+        
+        Returns:
+            bool: True si las vistas fueron refrescadas
+        """
+        try:
+            with self.engine.begin() as conn:
+                for view_name in self._MATERIALIZED_VIEWS:
+                    conn.exec_driver_sql(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view_name}")
+            
+            logger.info("✅ Vistas materializadas actualizadas")
+            return True
+            
+        except Exception as e:
+            logger.error(f"❌ Error refrescando vistas materializadas: {e}")
+            return False
+    
+    def _estimate_rows(self, conn, table_name):
+        """
+        Estimar el número de registros de una tabla sin recorrerla
+        
+        Args:
+            conn: Conexión SQLAlchemy abierta
+            table_name (str): Nombre de la tabla
+            
+        Returns:
+            str: Estimado desde pg_class o '?' si no hay estadísticas
+        """
+        if self.engine.dialect.name != 'postgresql':
+            return '?'
+        
+        result = conn.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table_name)"),
+            {'table_name': table_name}
+        )
+        estimate = result.scalar()
+        
+        # reltuples es -1 (o 0) si la tabla nunca fue analizada
+        return f"~{estimate}" if estimate and estimate > 0 else '?'
+    
+    def _copy_dataframe(self, df, table_name, raw=None):
+        """
+        Cargar un DataFrame con COPY FROM STDIN (PostgreSQL)
+        
+        Args:
+            df (pd.DataFrame): Datos a cargar
+            table_name (str): Nombre de la tabla destino
+            raw: Conexión psycopg2 con una transacción abierta (opcional)
+        """
+        buffer = io.StringIO()
+        df.to_csv(buffer, index=False, header=False, na_rep='')
+        buffer.seek(0)
+        
+        self._copy_from(buffer, table_name, list(df.columns), raw=raw)
+    
+    def _copy_dataframe_binary(self, df, table_name, raw=None):
+        """
+        Cargar un DataFrame con COPY ... WITH (FORMAT BINARY) usando pgpq
+        
+        El formato binario exige tipos idénticos, por lo que los datos se
+        copian a una tabla temporal con los tipos inferidos desde Arrow y
+        luego se insertan en la tabla destino con INSERT ... SELECT.
+        
+        Args:
+            df (pd.DataFrame): Datos a cargar
+            table_name (str): Nombre de la tabla destino
+            raw: Conexión psycopg2 con una transacción abierta (opcional)
+        """
+        arrow_table = pa.Table.from_pandas(df, preserve_index=False)
+        encoder = ArrowToPostgresBinaryEncoder(arrow_table.schema)
+        
+        buffer = io.BytesIO()
+        buffer.write(encoder.write_header())
+        for batch in arrow_table.to_batches():
+            buffer.write(encoder.write_batch(batch))
+        buffer.write(encoder.finish())
+        buffer.seek(0)
+        
+        staging_ddl = ', '.join(
+            f'"{name}" {column.data_type.ddl()}' for name, column in encoder.schema().columns
+        )
+        self._copy_from(buffer, table_name, list(df.columns), staging_ddl=staging_ddl, raw=raw)
+    
+    def _copy_file(self, file_path, table_name, raw=None):
+        """
+        Cargar un archivo CSV con COPY FROM STDIN sin pasar por pandas
+        
+        Args:
+            file_path (str): Ruta del archivo CSV (con encabezado)
+            table_name (str): Nombre de la tabla destino
+            
+        Returns:
+            int: Número de registros cargados
+        """
+        with open(file_path, 'rb') as f:
+            # El encabezado define el orden de columnas; el resto va directo a COPY
+            columns = f.readline().decode('utf-8-sig').strip().split(',')
+            return self._copy_from(f, table_name, columns, raw=raw)
+    
+    def _copy_from(self, source, table_name, columns, staging_ddl=None, raw=None):
+        """
+        Ejecutar COPY FROM STDIN sobre una conexión psycopg2
+        
+        Las tablas grandes (y todo COPY binario) se cargan primero en una
+        tabla temporal, que no genera WAL, y pasan a la tabla destino con
+        un solo INSERT ... SELECT en la misma transacción.
+        
+        Si se recibe una conexión abierta, la carga se suma a su transacción
+        y confirmar o revertir queda a cargo de quien llama.
+        
+        Args:
+            source: Objeto tipo archivo con datos CSV sin encabezado
+                (o datos binarios de COPY si se indica staging_ddl)
+            table_name (str): Nombre de la tabla destino
+            columns (list): Columnas en el orden de los datos
+            staging_ddl (str): Columnas de la tabla temporal para COPY binario
+            raw: Conexión psycopg2 con una transacción abierta (opcional)
+            
+        Returns:
+            int: Número de registros cargados
+        """
+        column_list = ', '.join(columns)
+        if staging_ddl:
+            copy_options = "FORMAT BINARY"
+        else:
+            copy_options = "FORMAT CSV, NULL ''"
+        
+        owns_connection = raw is None
+        if owns_connection:
+            raw = self.engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            # La carga es repetible desde el CSV: no esperar el fsync del WAL al confirmar
+            cursor.execute("SET LOCAL synchronous_commit = off")
+            if staging_ddl or table_name in self._STAGED_TABLES:
+                staging_table = f"stg_{table_name}"
+                staging_columns = staging_ddl or f"LIKE {table_name} INCLUDING DEFAULTS"
+                cursor.execute(f"CREATE TEMP TABLE {staging_table} ({staging_columns}) ON COMMIT DROP")
+                cursor.copy_expert(
+                    f"COPY {staging_table} ({column_list}) FROM STDIN WITH ({copy_options})",
+                    source
+                )
+                cursor.execute(
+                    f"INSERT INTO {table_name} ({column_list}) "
+                    f"SELECT {column_list} FROM {staging_table}"
+                )
+                rows = cursor.rowcount
+                # Liberar el nombre para el siguiente bloque de la misma transacción
+                cursor.execute(f"DROP TABLE {staging_table}")
+            else:
+                cursor.copy_expert(
+                    f"COPY {table_name} ({column_list}) FROM STDIN WITH ({copy_options})",
+                    source
+                )
+                rows = cursor.rowcount
+            if owns_connection:
+                raw.commit()
+            return rows
+        except Exception:
+            if owns_connection:
+                raw.rollback()
+            raise
+        finally:
+            if owns_connection:
+                raw.close()
+    
     def _convert_data_types(self, df, table_name):
         """
         Convertir tipos de datos según la tabla
@@ -220,28 +601,15 @@ class DatabaseManager:
         Returns:
             pd.DataFrame: DataFrame con tipos corregidos
         """
-        # Conversiones específicas por tabla
-        if table_name == 'inventario':
-            date_columns = ['fecha_ultima_compra', 'fecha_ultima_venta', 'fecha_creacion']
-            for col in date_columns:
-                if col in df.columns:
-                    df[col] = pd.to_datetime(df[col], errors='coerce')
-            
-            # Convertir booleanos
-            bool_columns = ['requiere_refrigeracion', 'es_peligroso', 'activo']
-            for col in bool_columns:
-                if col in df.columns:
-                    df[col] = df[col].astype(bool)
-        
-        elif table_name == 'movimientos_inventario':
-            if 'fecha_movimiento' in df.columns:
-                df['fecha_movimiento'] = pd.to_datetime(df['fecha_movimiento'], errors='coerce')
-        
-        elif table_name == 'alertas':
-            if 'fecha_generacion' in df.columns:
-                df['fecha_generacion'] = pd.to_datetime(df['fecha_generacion'], errors='coerce')
-            if 'fecha_resolucion' in df.columns:
-                df['fecha_resolucion'] = pd.to_datetime(df['fecha_resolucion'], errors='coerce')
+        # Fechas: una sola pasada sobre el subconjunto de columnas presentes
+        date_columns = [col for col in self._DATE_COLUMNS.get(table_name, []) if col in df.columns]
+        if date_columns:
+            df[date_columns] = df[date_columns].apply(pd.to_datetime, errors='coerce')
+        
+        # Booleanos: un solo astype con diccionario de tipos
+        bool_columns = {col: 'bool' for col in self._BOOL_COLUMNS.get(table_name, []) if col in df.columns}
+        if bool_columns:
+            df = df.astype(bool_columns)
         
         return df
     
@@ -264,6 +632,42 @@ class DatabaseManager:
             logger.error(f"❌ Error ejecutando consulta: {e}")
             return pd.DataFrame()
     
+    def copy_query(self, query):
+        """
+        Ejecutar una consulta de lectura con COPY ... TO STDOUT
+        
+        Para resultados grandes evita construir una tupla de Python por fila:
+        el resultado llega como un solo flujo CSV que se parsea en bloque.
+        
+        Args:
+            query (str): Consulta SELECT (sin parámetros)
+            
+        Returns:
+            pd.DataFrame: Resultados de la consulta
+        """
+        query = query.strip().rstrip(';')
+        buffer = io.BytesIO()
+        
+        raw = self.engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT CSV, HEADER)", buffer)
+            raw.commit()
+        except Exception as e:
+            raw.rollback()
+            logger.error(f"❌ Error ejecutando COPY: {e}")
+            return pd.DataFrame()
+        finally:
+            raw.close()
+        
+        buffer.seek(0)
+        return pd.read_csv(
+            buffer,
+            engine='pyarrow' if ARROW_AVAILABLE else 'c',
+            true_values=['t'],
+            false_values=['f']
+        )
+    
     def execute_advanced_queries(self):
         """
         Ejecutar consultas avanzadas del archivo SQL
@@ -285,12 +689,7 @@ class DatabaseManager:
                         i.stock_minimo,
                         i.ventas_mes_actual,
                         p.nombre_proveedor,
-                        CASE 
-                            WHEN i.stock_actual = 0 THEN 'SIN_STOCK'
-                            WHEN i.stock_actual <= i.stock_minimo THEN 'CRITICO'
-                            WHEN i.stock_actual <= i.punto_reorden THEN 'BAJO'
-                            ELSE 'NORMAL'
-                        END as estado_stock
+                        i.estado_stock
                     FROM inventario i
                     LEFT JOIN categorias c ON i.categoria_id = c.categoria_id
                     LEFT JOIN proveedores p ON i.proveedor_id = p.proveedor_id
@@ -306,12 +705,8 @@ class DatabaseManager:
                         c.nombre_categoria,
                         i.ventas_mes_actual,
                         i.stock_actual,
-                        ROUND((i.precio_venta - i.costo_unitario) * i.ventas_mes_actual, 2) as utilidad_mes,
-                        CASE 
-                            WHEN i.stock_actual <= i.stock_minimo THEN 'CRÍTICO'
-                            WHEN i.stock_actual <= i.punto_reorden THEN 'BAJO' 
-                            ELSE 'NORMAL'
-                        END as estado_stock
+                        ROUND(i.utilidad_mes, 2) as utilidad_mes,
+                        i.estado_stock
                     FROM inventario i
                     JOIN categorias c ON i.categoria_id = c.categoria_id
                     WHERE i.activo = true
@@ -319,47 +714,32 @@ class DatabaseManager:
                     LIMIT 15;
                 """,
                 
+                # Agregados precalculados en vistas materializadas (schema_completo.sql)
                 'rentabilidad_categoria': """
-                    SELECT 
-                        c.categoria_id,
-                        c.nombre_categoria,
-                        COUNT(*) as total_productos,
-                        SUM(i.stock_actual) as stock_total,
-                        ROUND(AVG(((i.precio_venta - i.costo_unitario) / i.precio_venta) * 100), 2) as margen_promedio_pct,
-                        ROUND(SUM(i.stock_actual * i.costo_unitario), 2) as valor_inventario,
-                        ROUND(SUM((i.precio_venta - i.costo_unitario) * i.ventas_mes_actual), 2) as utilidad_mes,
-                        ROUND(SUM(i.ventas_mes_actual * i.precio_venta), 2) as ingresos_mes
-                    FROM inventario i
-                    JOIN categorias c ON i.categoria_id = c.categoria_id
-                    WHERE i.activo = true
-                    GROUP BY c.categoria_id, c.nombre_categoria
+                    SELECT * FROM mv_rentabilidad_categoria
                     ORDER BY utilidad_mes DESC;
                 """,
                 
                 'kpis_principales': """
-                    SELECT 
-                        'RESUMEN EJECUTIVO' as seccion,
-                        COUNT(*) as total_productos,
-                        COUNT(*) FILTER (WHERE stock_actual > 0) as productos_en_stock,
-                        COUNT(*) FILTER (WHERE stock_actual <= stock_minimo) as productos_stock_critico,
-                        ROUND(SUM(stock_actual * costo_unitario), 2) as valor_total_inventario,
-                        ROUND(SUM(ventas_mes_actual * precio_venta), 2) as ingresos_mes_actual,
-                        ROUND(SUM((precio_venta - costo_unitario) * ventas_mes_actual), 2) as utilidad_bruta_mes,
-                        ROUND(AVG(((precio_venta - costo_unitario) / precio_venta) * 100), 2) as margen_promedio_pct,
-                        SUM(ventas_mes_actual) as unidades_vendidas_mes
-                    FROM inventario 
-                    WHERE activo = true;
+                    SELECT * FROM mv_kpis_principales;
                 """
             }
             
-            for query_name, query_sql in queries.items():
-                try:
-                    result = self.execute_query(query_sql)
-                    results[query_name] = result
-                    logger.info(f"✅ Consulta {query_name}: {len(result)} registros")
-                except Exception as e:
-                    logger.error(f"❌ Error en consulta {query_name}: {e}")
-                    results[query_name] = pd.DataFrame()
+            # Consultas independientes: ejecutarlas en paralelo, una conexión del pool por hilo
+            with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+                futures = {
+                    query_name: executor.submit(self._read_query, query_name, query_sql)
+                    for query_name, query_sql in queries.items()
+                }
+                
+                for query_name, future in futures.items():
+                    try:
+                        result = future.result()
+                        results[query_name] = result
+                        logger.info(f"✅ Consulta {query_name}: {len(result)} registros")
+                    except Exception as e:
+                        logger.error(f"❌ Error en consulta {query_name}: {e}")
+                        results[query_name] = pd.DataFrame()
             
             return results
             
@@ -367,39 +747,78 @@ class DatabaseManager:
             logger.error(f"❌ Error ejecutando consultas avanzadas: {e}")
             return {}
     
-    def backup_database(self, backup_path=None):
+    def _read_query(self, query_name, query):
+        """
+        Ejecutar una consulta preparada en su propia conexión (apto para hilos)
+        
+        La consulta se prepara (PREPARE) la primera vez que se usa en cada
+        conexión del pool; las siguientes ejecuciones solo envían EXECUTE
+        y PostgreSQL omite el parseo y la planificación.
+        
+        Args:
+            query_name (str): Nombre de la consulta (identifica la sentencia preparada)
+            query (str): Consulta SQL
+            
+        Returns:
+            pd.DataFrame: Resultados de la consulta
+        """
+        statement_name = f"q_{query_name}"
+        
+        # Con pyarrow los resultados quedan en columnas Arrow en lugar de objetos Python
+        dtype_backend = 'pyarrow' if ARROW_AVAILABLE else 'numpy_nullable'
+        
+        with self.engine.connect() as conn:
+            # info persiste con la conexión DBAPI mientras siga en el pool
+            prepared = conn.connection.info.setdefault('prepared_statements', set())
+            if statement_name not in prepared:
+                conn.exec_driver_sql(f"PREPARE {statement_name} AS {query.strip().rstrip(';')}")
+                prepared.add(statement_name)
+            
+            return pd.read_sql_query(text(f"EXECUTE {statement_name}"), conn, dtype_backend=dtype_backend)
+    
+    def backup_database(self, backup_path=None, jobs=4):
         """
         Crear backup de la base de datos
         
+        Usa el formato de directorio de pg_dump (-Fd), que permite volcar
+        varias tablas en paralelo y comprime cada archivo. Se restaura con
+        pg_restore -j N.
+        
         Args:
-            backup_path (str): Ruta donde guardar el backup
+            backup_path (str): Directorio donde guardar el backup (no debe existir)
+            jobs (int): Número de procesos paralelos de pg_dump
             
         Returns:
-            str: Ruta del archivo de backup creado
+            str: Ruta del directorio de backup creado
         """
         try:
             if not backup_path:
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                backup_path = f"backups/ferreteria_petapa_backup_{timestamp}.sql"
+                backup_path = f"backups/ferreteria_petapa_backup_{timestamp}"
             
             # Crear directorio de backups si no existe
             os.makedirs(os.path.dirname(backup_path), exist_ok=True)
             
-            # Comando pg_dump
-            cmd = (
-                f"pg_dump -h {self.config['host']} -p {self.config['port']} "
-                f"-U {self.config['username']} -d {self.config['database']} "
-                f"-f {backup_path} --verbose"
-            )
+            # Comando pg_dump (lista de argumentos, sin shell)
+            cmd = [
+                'pg_dump',
+                '-h', self.config['host'],
+                '-p', str(self.config['port']),
+                '-U', self.config['username'],
+                '-d', self.config['database'],
+                '-Fd', '-j', str(jobs), '-Z', '6',
+                '-f', backup_path
+            ]
+            env = {**os.environ, 'PGPASSWORD': self.config['password']}
             
             # Ejecutar comando (requiere que pg_dump esté en PATH)
-            result = os.system(cmd)
+            result = subprocess.run(cmd, env=env, capture_output=True, text=True)
             
-            if result == 0:
+            if result.returncode == 0:
                 logger.info(f"✅ Backup creado exitosamente: {backup_path}")
                 return backup_path
             else:
-                logger.error("❌ Error creando backup")
+                logger.error(f"❌ Error creando backup: {result.stderr.strip()}")
                 return None
                 
         except Exception as e:
@@ -440,12 +859,13 @@ class DatabaseManager:
             bool: True si la optimización fue exitosa
         """
         try:
-            with self.engine.connect() as conn:
+            # VACUUM no puede ejecutarse dentro de una transacción
+            with self.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
                 # VACUUM para limpiar datos muertos
-                conn.execute(text("VACUUM"))
+                conn.exec_driver_sql("VACUUM")
                 
                 # ANALYZE para actualizar estadísticas
-                conn.execute(text("ANALYZE"))
+                conn.exec_driver_sql("ANALYZE")
                 
                 logger.info("✅ Base de datos optimizada (VACUUM + ANALYZE)")
                 return True
@@ -500,23 +920,39 @@ def test_connection(config=None):
     """
     db = DatabaseManager(config)
     
+    # connect() ya ejecuta SELECT 1: suficiente como prueba de vida
     if db.connect():
-        # Ejecutar consulta de prueba
-        result = db.execute_query("SELECT version();")
-        if not result.empty:
-            print(f"✅ PostgreSQL Version: {result.iloc[0, 0]}")
-            
-        # Mostrar estadísticas básicas
-        stats = db.get_table_stats()
-        if not stats.empty:
-            print(f"📊 Tablas en la base de datos: {len(stats)}")
-            
+        print("✅ Conexión a PostgreSQL exitosa")
         db.disconnect()
         return True
     else:
         print("❌ No se pudo conectar a la base de datos")
         return False
 
+def show_table_stats(config=None):
+    """
+    Mostrar estadísticas de las tablas (pg_stat_user_tables)
+    
+    Args:
+        config (dict): Configuración personalizada
+        
+    Returns:
+        bool: True si se obtuvieron las estadísticas
+    """
+    db = DatabaseManager(config)
+    
+    if not db.connect():
+        print("❌ No se pudo conectar a la base de datos")
+        return False
+    
+    stats = db.get_table_stats()
+    db.disconnect()
+    
+    print(f"📊 Tablas en la base de datos: {len(stats)}")
+    if not stats.empty:
+        print(stats[['tablename', 'live_rows', 'dead_rows', 'last_analyze']].to_string(index=False))
+    return True
+
 def setup_database(force_reload=False):
     """
     Configurar completamente la base de datos
@@ -534,14 +970,20 @@ def setup_database(force_reload=False):
     if not db.connect():
         return False
     
-    # Crear tablas
+    # Crear tablas (sin índices secundarios)
     if not db.create_tables():
         return False
     
-    # Cargar datos
+    # Cargar datos sin índices y crearlos al final
+    if force_reload:
+        db.drop_indexes()
+    
     if not db.load_csv_data(force_reload):
         return False
     
+    if not db.create_indexes():
+        return False
+    
     # Optimizar base de datos
     db.optimize_database()
     
@@ -569,6 +1011,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Gestor de Base de Datos - Ferretería Petapa")
     parser.add_argument('--setup', action='store_true', help='Configurar base de datos completa')
     parser.add_argument('--test', action='store_true', help='Probar conexión')
+    parser.add_argument('--stats', action='store_true', help='Mostrar estadísticas de tablas')
     parser.add_argument('--backup', action='store_true', help='Crear backup')
     parser.add_argument('--reload', action='store_true', help='Forzar recarga de datos')
     parser.add_argument('--optimize', action='store_true', help='Optimizar base de datos')
@@ -580,6 +1023,8 @@ if __name__ == "__main__":
         create_sample_config()
     elif args.test:
         test_connection()
+    elif args.stats:
+        show_table_stats()
     elif args.setup:
         setup_database(force_reload=args.reload)
     elif args.backup:
@@ -596,10 +1041,11 @@ if __name__ == "__main__":
             db.disconnect()
     else:
         print("🔧 Gestor de Base de Datos - Ferretería Petapa")
-        print("Uso: python database_config.py [--setup|--test|--backup|--reload|--optimize|--create-config]")
+        print("Uso: python database_config.py [--setup|--test|--stats|--backup|--reload|--optimize|--create-config]")
         print("\nOpciones:")
         print("  --setup         Configurar base de datos completa")
         print("  --test          Probar conexión a la base de datos")
+        print("  --stats         Mostrar estadísticas de tablas")
         print("  --backup        Crear backup de la base de datos")
         print("  --reload        Forzar recarga de datos CSV")
         print("  --optimize      Optimizar base de datos (VACUUM + ANALYZE)")
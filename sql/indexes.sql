@@ -0,0 +1,19 @@
+-- =====================================================
+-- ÍNDICES PARA OPTIMIZACIÓN
+-- Ferretería Petapa - Business Intelligence Demo
+-- =====================================================
+-- Se aplican después de la carga masiva de datos (DatabaseManager.create_indexes)
+-- para no mantener cada índice fila por fila durante COPY.
+
+-- Más memoria para ordenar durante la construcción de índices (solo esta transacción)
+SET LOCAL maintenance_work_mem = '512MB';
+
+-- Índices para consultas frecuentes
+CREATE INDEX IF NOT EXISTS idx_inventario_categoria ON inventario(categoria_id);
+CREATE INDEX IF NOT EXISTS idx_inventario_proveedor ON inventario(proveedor_id);
+CREATE INDEX IF NOT EXISTS idx_inventario_stock_bajo ON inventario(stock_actual, stock_minimo) WHERE stock_actual <= stock_minimo;
+CREATE INDEX IF NOT EXISTS idx_inventario_criticos ON inventario(stock_actual, ventas_mes_actual DESC) WHERE activo = TRUE AND stock_actual <= stock_minimo;
+CREATE INDEX IF NOT EXISTS idx_inventario_ventas_mes ON inventario(ventas_mes_actual DESC);
+CREATE INDEX IF NOT EXISTS idx_movimientos_fecha ON movimientos_inventario(fecha_movimiento DESC);
+CREATE INDEX IF NOT EXISTS idx_movimientos_producto ON movimientos_inventario(producto_id);
+CREATE INDEX IF NOT EXISTS idx_alertas_activas ON alertas(estado, fecha_generacion) WHERE estado = 'ACTIVA';
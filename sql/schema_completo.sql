@@ -4,7 +4,7 @@
 -- =====================================================
 
 -- Tabla de Categorías
-CREATE TABLE categorias (
+CREATE TABLE IF NOT EXISTS categorias (
     categoria_id INT PRIMARY KEY,
     nombre_categoria VARCHAR(50) NOT NULL,
     descripcion TEXT,
@@ -14,7 +14,7 @@ CREATE TABLE categorias (
 );
 
 -- Tabla de Proveedores
-CREATE TABLE proveedores (
+CREATE TABLE IF NOT EXISTS proveedores (
     proveedor_id INT PRIMARY KEY,
     nombre_proveedor VARCHAR(100) NOT NULL,
     contacto VARCHAR(100),
@@ -30,7 +30,7 @@ CREATE TABLE proveedores (
 );
 
 -- Tabla de Ubicaciones en Almacén
-CREATE TABLE ubicaciones (
+CREATE TABLE IF NOT EXISTS ubicaciones (
     ubicacion_id INT PRIMARY KEY,
     seccion VARCHAR(20) NOT NULL,
     pasillo VARCHAR(10),
@@ -41,7 +41,7 @@ CREATE TABLE ubicaciones (
 );
 
 -- Tabla Principal de Inventario (EXPANDIDA)
-CREATE TABLE inventario (
+CREATE TABLE IF NOT EXISTS inventario (
     producto_id INT PRIMARY KEY,
     nombre VARCHAR(100) NOT NULL,
     descripcion TEXT,
@@ -94,8 +94,24 @@ CREATE TABLE inventario (
     FOREIGN KEY (ubicacion_id) REFERENCES ubicaciones(ubicacion_id)
 );
 
+-- Columnas derivadas calculadas al escribir (evitan recalcular en cada consulta)
+ALTER TABLE inventario
+    ADD COLUMN IF NOT EXISTS utilidad_mes NUMERIC
+        GENERATED ALWAYS AS ((precio_venta - costo_unitario) * ventas_mes_actual) STORED,
+    ADD COLUMN IF NOT EXISTS margen_pct NUMERIC
+        GENERATED ALWAYS AS (((precio_venta - costo_unitario) / NULLIF(precio_venta, 0)) * 100) STORED,
+    ADD COLUMN IF NOT EXISTS estado_stock VARCHAR(10)
+        GENERATED ALWAYS AS (
+            CASE 
+                WHEN stock_actual = 0 THEN 'SIN_STOCK'
+                WHEN stock_actual <= stock_minimo THEN 'CRITICO'
+                WHEN stock_actual <= punto_reorden THEN 'BAJO'
+                ELSE 'NORMAL'
+            END
+        ) STORED;
+
 -- Tabla de Historial de Movimientos
-CREATE TABLE movimientos_inventario (
+CREATE TABLE IF NOT EXISTS movimientos_inventario (
     movimiento_id SERIAL PRIMARY KEY,
     producto_id INT NOT NULL,
     tipo_movimiento VARCHAR(20) NOT NULL, -- 'ENTRADA', 'SALIDA', 'AJUSTE', 'MERMA'
@@ -113,7 +129,7 @@ CREATE TABLE movimientos_inventario (
 );
 
 -- Tabla de Alertas
-CREATE TABLE alertas (
+CREATE TABLE IF NOT EXISTS alertas (
     alerta_id SERIAL PRIMARY KEY,
     producto_id INT NOT NULL,
     tipo_alerta VARCHAR(30) NOT NULL, -- 'STOCK_BAJO', 'VENCIMIENTO', 'SIN_MOVIMIENTO'
@@ -128,7 +144,7 @@ CREATE TABLE alertas (
 );
 
 -- Tabla de Órdenes de Compra
-CREATE TABLE ordenes_compra (
+CREATE TABLE IF NOT EXISTS ordenes_compra (
     orden_id SERIAL PRIMARY KEY,
     proveedor_id INT NOT NULL,
     fecha_orden DATE NOT NULL,
@@ -145,7 +161,7 @@ CREATE TABLE ordenes_compra (
 );
 
 -- Tabla de Detalles de Órdenes de Compra
-CREATE TABLE detalle_ordenes_compra (
+CREATE TABLE IF NOT EXISTS detalle_ordenes_compra (
     detalle_id SERIAL PRIMARY KEY,
     orden_id INT NOT NULL,
     producto_id INT NOT NULL,
@@ -161,22 +177,14 @@ CREATE TABLE detalle_ordenes_compra (
 -- =====================================================
 -- ÍNDICES PARA OPTIMIZACIÓN
 -- =====================================================
-
--- Índices para consultas frecuentes
-CREATE INDEX idx_inventario_categoria ON inventario(categoria_id);
-CREATE INDEX idx_inventario_proveedor ON inventario(proveedor_id);
-CREATE INDEX idx_inventario_stock_bajo ON inventario(stock_actual, stock_minimo) WHERE stock_actual <= stock_minimo;
-CREATE INDEX idx_inventario_ventas_mes ON inventario(ventas_mes_actual DESC);
-CREATE INDEX idx_movimientos_fecha ON movimientos_inventario(fecha_movimiento DESC);
-CREATE INDEX idx_movimientos_producto ON movimientos_inventario(producto_id);
-CREATE INDEX idx_alertas_activas ON alertas(estado, fecha_generacion) WHERE estado = 'ACTIVA';
+-- Definidos en sql/indexes.sql: se crean después de la carga masiva
 
 -- =====================================================
 -- VISTAS PARA REPORTES COMUNES
 -- =====================================================
 
 -- Vista de Productos con Stock Crítico
-CREATE VIEW vista_stock_critico AS
+CREATE OR REPLACE VIEW vista_stock_critico AS
 SELECT 
     i.producto_id,
     i.nombre,
@@ -200,7 +208,7 @@ WHERE i.activo = TRUE
 ORDER BY i.stock_actual ASC, i.ventas_mes_actual DESC;
 
 -- Vista de Análisis de Rentabilidad
-CREATE VIEW vista_rentabilidad AS
+CREATE OR REPLACE VIEW vista_rentabilidad AS
 SELECT 
     i.producto_id,
     i.nombre,
@@ -222,7 +230,7 @@ WHERE i.activo = TRUE
 ORDER BY utilidad_mes DESC NULLS LAST;
 
 -- Vista de Top Productos
-CREATE VIEW vista_top_productos AS
+CREATE OR REPLACE VIEW vista_top_productos AS
 SELECT 
     i.producto_id,
     i.nombre,
@@ -239,6 +247,83 @@ LEFT JOIN categorias c ON i.categoria_id = c.categoria_id
 WHERE i.activo = TRUE AND i.ventas_mes_actual > 0
 ORDER BY i.ventas_mes_actual DESC;
 
+-- =====================================================
+-- VISTAS MATERIALIZADAS PARA KPIs
+-- =====================================================
+-- Se refrescan después de cargar inventario (ver DatabaseManager)
+-- Los índices únicos permiten REFRESH MATERIALIZED VIEW CONCURRENTLY
+
+-- KPIs principales del negocio
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_kpis_principales AS
+SELECT 
+    'RESUMEN EJECUTIVO' as seccion,
+    COUNT(*) as total_productos,
+    COUNT(*) FILTER (WHERE stock_actual > 0) as productos_en_stock,
+    COUNT(*) FILTER (WHERE stock_actual <= stock_minimo) as productos_stock_critico,
+    ROUND(SUM(stock_actual * costo_unitario), 2) as valor_total_inventario,
+    ROUND(SUM(ventas_mes_actual * precio_venta), 2) as ingresos_mes_actual,
+    ROUND(SUM(utilidad_mes), 2) as utilidad_bruta_mes,
+    ROUND(AVG(margen_pct), 2) as margen_promedio_pct,
+    SUM(ventas_mes_actual) as unidades_vendidas_mes
+FROM inventario 
+WHERE activo = TRUE;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_kpis_principales ON mv_kpis_principales(seccion);
+
+-- Rentabilidad por categoría
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_rentabilidad_categoria AS
+SELECT 
+    c.categoria_id,
+    c.nombre_categoria,
+    COUNT(*) as total_productos,
+    SUM(i.stock_actual) as stock_total,
+    ROUND(AVG(i.margen_pct), 2) as margen_promedio_pct,
+    ROUND(SUM(i.stock_actual * i.costo_unitario), 2) as valor_inventario,
+    ROUND(SUM(i.utilidad_mes), 2) as utilidad_mes,
+    ROUND(SUM(i.ventas_mes_actual * i.precio_venta), 2) as ingresos_mes
+FROM inventario i
+JOIN categorias c ON i.categoria_id = c.categoria_id
+WHERE i.activo = TRUE
+GROUP BY c.categoria_id, c.nombre_categoria;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_rentabilidad_categoria ON mv_rentabilidad_categoria(categoria_id);
+
+-- Inventario enriquecido para el dashboard (JOIN + métricas derivadas)
+-- estado_stock viene de la columna generada de inventario
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_inventario_enriquecido AS
+SELECT 
+    i.*,
+    c.nombre_categoria,
+    c.margen_promedio as categoria_margen,
+    p.nombre_proveedor,
+    p.calificacion as proveedor_calificacion,
+    p.tiempo_entrega_dias,
+    u.seccion || '-' || u.pasillo || '-' || u.estante as ubicacion_codigo,
+    u.descripcion as ubicacion_descripcion,
+    (i.precio_venta - i.costo_unitario)::DOUBLE PRECISION as utilidad_unitaria,
+    ROUND(i.margen_pct, 2)::DOUBLE PRECISION as margen_porcentaje,
+    (i.stock_actual * i.costo_unitario)::DOUBLE PRECISION as valor_inventario,
+    CASE 
+        WHEN i.stock_actual > 0 THEN i.ventas_mes_actual::DOUBLE PRECISION / i.stock_actual
+        ELSE 0
+    END as rotacion_mensual,
+    CASE 
+        WHEN i.ventas_mes_actual > 0 THEN i.stock_actual::DOUBLE PRECISION / i.ventas_mes_actual
+        ELSE 999
+    END as meses_inventario,
+    CASE 
+        WHEN i.ventas_mes_anterior > 0 
+            THEN (i.ventas_mes_actual - i.ventas_mes_anterior)::DOUBLE PRECISION / i.ventas_mes_anterior * 100
+        ELSE 0
+    END as crecimiento_pct
+FROM inventario i
+LEFT JOIN categorias c ON i.categoria_id = c.categoria_id
+LEFT JOIN proveedores p ON i.proveedor_id = p.proveedor_id
+LEFT JOIN ubicaciones u ON i.ubicacion_id = u.ubicacion_id
+WHERE i.activo = TRUE;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_inventario_enriquecido ON mv_inventario_enriquecido(producto_id);
+
 -- =====================================================
 -- TRIGGERS PARA AUTOMATIZACIÓN
 -- =====================================================
@@ -253,6 +338,7 @@ END;
 $$ LANGUAGE plpgsql;
 
 -- Trigger para inventario
+DROP TRIGGER IF EXISTS trigger_actualizar_inventario ON inventario;
 CREATE TRIGGER trigger_actualizar_inventario
     BEFORE UPDATE ON inventario
     FOR EACH ROW
@@ -275,6 +361,7 @@ END;
 $$ LANGUAGE plpgsql;
 
 -- Trigger para alertas de stock
+DROP TRIGGER IF EXISTS trigger_alertas_stock ON inventario;
 CREATE TRIGGER trigger_alertas_stock
     AFTER UPDATE OF stock_actual ON inventario
     FOR EACH ROW
@@ -24,8 +24,10 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import numpy as np
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 import os
 import sys
+import hashlib
 
 # Agregar directorio actual al path para imports locales
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -39,9 +41,95 @@ except ImportError as e:
     st.warning(f"⚠️ Módulos de base de datos no disponibles: {e}")
     DATABASE_AVAILABLE = False
 
+# Parser CSV y snapshots Parquet con pyarrow (opcional)
+try:
+    import pyarrow  # noqa: F401
+    CSV_ENGINE = 'pyarrow'
+    PARQUET_AVAILABLE = True
+except ImportError:
+    CSV_ENGINE = 'c'
+    PARQUET_AVAILABLE = False
+
+# Kernel compilado para las métricas por fila (opcional)
+try:
+    from numba import guvectorize, njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
 import warnings
 warnings.filterwarnings('ignore')
 
+# Estados de stock, de mayor a menor severidad
+ESTADOS_STOCK = ['🔴 SIN STOCK', '🟠 CRÍTICO', '🟡 BAJO', '🟢 NORMAL']
+
+# Etiquetas de la columna generada inventario.estado_stock en PostgreSQL
+ESTADOS_STOCK_BD = {
+    'SIN_STOCK': '🔴 SIN STOCK',
+    'CRITICO': '🟠 CRÍTICO',
+    'BAJO': '🟡 BAJO',
+    'NORMAL': '🟢 NORMAL'
+}
+
+# Tipos numéricos compactos para las columnas de inventario
+TIPOS_COMPACTOS = {
+    'stock_actual': 'int32',
+    'stock_minimo': 'int32',
+    'punto_reorden': 'int32',
+    'ventas_mes_actual': 'int32',
+    'ventas_mes_anterior': 'int32',
+    'costo_unitario': 'float32',
+    'precio_venta': 'float32'
+}
+
+# Columnas de texto con pocos valores distintos
+COLUMNAS_CATEGORICAS = ['nombre_categoria', 'nombre_proveedor']
+
+# Columnas que usan KPIs, gráficos y modelos; el resto se descarta al cargar
+COLUMNAS_USADAS = [
+    'producto_id', 'nombre', 'categoria_id', 'proveedor_id', 'ubicacion_id',
+    'stock_actual', 'stock_minimo', 'punto_reorden', 'precio_venta', 'costo_unitario',
+    'ventas_mes_actual', 'ventas_mes_anterior', 'ventas_trimestre', 'activo',
+    'nombre_categoria', 'nombre_proveedor',
+    # Precalculadas en mv_inventario_enriquecido
+    'utilidad_unitaria', 'margen_porcentaje', 'utilidad_mes', 'valor_inventario',
+    'rotacion_mensual', 'meses_inventario', 'crecimiento_pct', 'estado_stock'
+]
+
+# Fuentes CSV del inventario combinado (con su esquema) y su snapshot Parquet
+CSV_INVENTARIO = {
+    'data/inventario_expandido.csv': {
+        **TIPOS_COMPACTOS,
+        'categoria_id': 'int32',
+        'proveedor_id': 'int32',
+        'ubicacion_id': 'int32',
+        'requiere_refrigeracion': 'bool',
+        'es_peligroso': 'bool',
+        'activo': 'bool'
+    },
+    'data/categorias.csv': {
+        'categoria_id': 'int32',
+        'margen_promedio': 'float32',
+        'activo': 'bool'
+    },
+    'data/proveedores.csv': {
+        'proveedor_id': 'int32',
+        'tiempo_entrega_dias': 'int32',
+        'calificacion': 'float32',
+        'activo': 'bool'
+    },
+    'data/ubicaciones.csv': {
+        'ubicacion_id': 'int32',
+        'nivel': 'int32',
+        'capacidad_maxima': 'int32'
+    }
+}
+CACHE_DIR = 'cache'
+
+# Versión del esquema del snapshot: subir al cambiar compactar_tipos o
+# proyectar_columnas de forma que no se refleje en las constantes de arriba
+VERSION_SNAPSHOT = 1
+
 # ================================
 # CONFIGURACIÓN INICIAL
 # ================================
@@ -78,10 +166,8 @@ st.set_page_config(
 )
 
 # CSS personalizado mejorado
-st.markdown("""
+CUSTOM_CSS = """
 <style>
-    @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap');
-    
     .main-header {
         background: linear-gradient(135deg, #1e3a8a 0%, #3b82f6 50%, #60a5fa 100%);
         padding: 2rem;
@@ -163,12 +249,28 @@ st.markdown("""
         margin: 1rem 0;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
 
 # ================================
 # FUNCIONES DE DATOS
 # ================================
 
+@st.cache_resource
+def get_db():
+    """
+    Gestor de base de datos compartido entre reruns (un solo engine y pool)
+    
+    Returns:
+        DatabaseManager: Gestor conectado
+    """
+    db = DatabaseManager()
+    if not db.connect():
+        # Una excepción no queda en caché: el siguiente rerun reintenta
+        raise ConnectionError("No se pudo conectar a PostgreSQL")
+    return db
+
 @st.cache_data(ttl=300)  # Cache por 5 minutos
 def load_data_source():
     """
@@ -180,42 +282,35 @@ def load_data_source():
     if DATABASE_AVAILABLE and os.getenv('DATABASE_URL'):
         # Intentar cargar desde base de datos
         try:
-            db = DatabaseManager()
-            if db.connect():
+            db = get_db()
+            if db.engine is not None:
                 st.sidebar.success("🔗 Conectado a PostgreSQL")
                 
-                # Cargar datos principales con JOIN
+                # Datos principales: JOIN y métricas derivadas precalculados en la BD
                 query = """
-                SELECT 
-                    i.*,
-                    c.nombre_categoria,
-                    c.margen_promedio as categoria_margen,
-                    p.nombre_proveedor,
-                    p.calificacion as proveedor_calificacion,
-                    p.tiempo_entrega_dias,
-                    u.seccion || '-' || u.pasillo || '-' || u.estante as ubicacion_codigo,
-                    u.descripcion as ubicacion_descripcion
-                FROM inventario i
-                LEFT JOIN categorias c ON i.categoria_id = c.categoria_id
-                LEFT JOIN proveedores p ON i.proveedor_id = p.proveedor_id
-                LEFT JOIN ubicaciones u ON i.ubicacion_id = u.ubicacion_id
-                WHERE i.activo = true
-                ORDER BY i.producto_id;
+                SELECT * FROM mv_inventario_enriquecido
+                ORDER BY producto_id;
                 """
                 
-                df = db.execute_query(query)
+                # Inventario, alertas y movimientos en paralelo (una conexión del pool por hilo)
+                with ThreadPoolExecutor(max_workers=3) as executor:
+                    f_df = executor.submit(db.copy_query, query)
+                    f_alertas = executor.submit(db.execute_query, "SELECT * FROM alertas WHERE estado = 'ACTIVA' ORDER BY fecha_generacion DESC;")
+                    f_movimientos = executor.submit(db.execute_query, "SELECT * FROM movimientos_inventario ORDER BY fecha_movimiento DESC LIMIT 100;")
                 
-                # Cargar alertas y movimientos
+                df = compactar_tipos(proyectar_columnas(f_df.result()))
+                
+                # Alertas y movimientos son opcionales
                 try:
-                    alertas = db.execute_query("SELECT * FROM alertas WHERE estado = 'ACTIVA' ORDER BY fecha_generacion DESC;")
-                    movimientos = db.execute_query("SELECT * FROM movimientos_inventario ORDER BY fecha_movimiento DESC LIMIT 100;")
+                    alertas = f_alertas.result()
+                    movimientos = f_movimientos.result()
                 except:
                     alertas = pd.DataFrame()
                     movimientos = pd.DataFrame()
                 
-                db.disconnect()
-                
                 if not df.empty:
+                    # Momento de la carga: distingue esta carga de la siguiente tras el ttl
+                    df.attrs['cargado'] = datetime.now()
                     return df, alertas, movimientos, True
                 
         except Exception as e:
@@ -223,7 +318,9 @@ def load_data_source():
     
     # Fallback a archivos CSV
     st.sidebar.info("📁 Cargando desde archivos CSV")
-    return load_csv_data()
+    df, alertas, movimientos, es_db = load_csv_data()
+    df.attrs['cargado'] = datetime.now()
+    return df, alertas, movimientos, es_db
 
 def load_csv_data():
     """
@@ -234,15 +331,7 @@ def load_csv_data():
     """
     try:
         # Cargar datos principales
-        inventario = pd.read_csv('data/inventario_expandido.csv')
-        categorias = pd.read_csv('data/categorias.csv')
-        proveedores = pd.read_csv('data/proveedores.csv')
-        ubicaciones = pd.read_csv('data/ubicaciones.csv')
-        
-        # Combinar datos
-        df = inventario.merge(categorias, on='categoria_id', how='left')
-        df = df.merge(proveedores, on='proveedor_id', how='left')
-        df = df.merge(ubicaciones, on='ubicacion_id', how='left')
+        df = load_inventory_csv()
         
         # Datos opcionales
         try:
@@ -258,6 +347,167 @@ def load_csv_data():
         st.error(f"❌ Archivos de datos no encontrados: {e}")
         return pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), False
 
+def load_inventory_csv():
+    """
+    Inventario combinado desde CSV, reutilizando el snapshot Parquet si
+    ningún archivo fuente cambió desde que se generó
+    
+    Returns:
+        pd.DataFrame: Inventario con categorías, proveedores y ubicaciones
+    """
+    # Fechas de los CSV más el esquema con que se generó: un cambio de
+    # columnas o tipos invalida el snapshot igual que un CSV nuevo
+    firma = (
+        VERSION_SNAPSHOT, CSV_INVENTARIO, TIPOS_COMPACTOS, COLUMNAS_USADAS,
+        [os.path.getmtime(ruta) for ruta in CSV_INVENTARIO]
+    )
+    digest = hashlib.sha1(repr(firma).encode('utf-8')).hexdigest()[:16]
+    snapshot = os.path.join(CACHE_DIR, f"inventario_{digest}.parquet")
+    
+    if PARQUET_AVAILABLE and os.path.exists(snapshot):
+        try:
+            return pd.read_parquet(snapshot, engine='pyarrow')
+        except Exception:
+            # Snapshot ilegible: se regenera desde los CSV
+            pass
+    
+    inventario, categorias, proveedores, ubicaciones = (
+        pd.read_csv(ruta, dtype=esquema, engine=CSV_ENGINE)
+        for ruta, esquema in CSV_INVENTARIO.items()
+    )
+    
+    # Claves de join como enteros densos int32
+    categorias = claves_enteras(inventario, categorias, 'categoria_id').set_index('categoria_id')
+    proveedores = claves_enteras(inventario, proveedores, 'proveedor_id').set_index('proveedor_id')
+    ubicaciones = claves_enteras(inventario, ubicaciones, 'ubicacion_id').set_index('ubicacion_id')
+    
+    # Combinar datos (join contra el índice de las tablas pequeñas)
+    df = (
+        inventario
+        .join(categorias, on='categoria_id', rsuffix='_categoria')
+        .join(proveedores, on='proveedor_id', rsuffix='_proveedor')
+        .join(ubicaciones, on='ubicacion_id', rsuffix='_ubicacion')
+    )
+    df = compactar_tipos(proyectar_columnas(df))
+    
+    if PARQUET_AVAILABLE:
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            # Escribir aparte y reemplazar atómicamente: otra sesión nunca
+            # lee un snapshot a medio escribir
+            temporal = f"{snapshot}.{os.getpid()}.tmp"
+            df.to_parquet(temporal, engine='pyarrow', compression='zstd')
+            os.replace(temporal, snapshot)
+            
+            # Descartar snapshots de versiones anteriores
+            for archivo in os.listdir(CACHE_DIR):
+                ruta = os.path.join(CACHE_DIR, archivo)
+                if archivo.startswith('inventario_') and archivo.endswith('.parquet') and ruta != snapshot:
+                    try:
+                        os.remove(ruta)
+                    except OSError:
+                        # Abierto por otra sesión (Windows): se borra en la próxima regeneración
+                        pass
+        except OSError:
+            # Sin permisos de escritura: se sigue sin snapshot
+            pass
+    
+    return df
+
+if NUMBA_AVAILABLE:
+    @guvectorize(
+        # Montos del mes (utilidad_mes, valor) en f8, igual que la ruta NumPy: sus sumas no pierden centavos
+        ['void(f4[:], f4[:], i4[:], i4[:], i4[:], f4[:], f4[:], f8[:], f8[:], f4[:], f4[:], f4[:])'],
+        '(n),(n),(n),(n),(n)->(n),(n),(n),(n),(n),(n),(n)',
+        nopython=True, cache=True
+    )
+    def metricas_inventario(precio, costo, stock, ventas, ventas_ant,
+                            utilidad_unitaria, margen, utilidad_mes, valor,
+                            rotacion, meses, crecimiento):
+        """Métricas derivadas de inventario en una sola pasada por fila"""
+        for i in range(precio.shape[0]):
+            utilidad = precio[i] - costo[i]
+            utilidad_unitaria[i] = utilidad
+            margen[i] = utilidad / precio[i] * 100 if precio[i] != 0 else np.nan
+            utilidad_mes[i] = np.float64(utilidad) * ventas[i]
+            valor[i] = np.float64(costo[i]) * stock[i]
+            rotacion[i] = ventas[i] / stock[i] if stock[i] > 0 else 0
+            meses[i] = stock[i] / ventas[i] if ventas[i] > 0 else 999
+            if ventas_ant[i] > 0:
+                crecimiento[i] = (ventas[i] - ventas_ant[i]) / ventas_ant[i] * 100
+            else:
+                crecimiento[i] = 0
+    
+    @njit(parallel=True, cache=True)
+    def clasificar_stock(stock, minimo, reorden, out):
+        """Código de estado de stock por fila (0 sin stock ... 3 normal)"""
+        for i in prange(stock.shape[0]):
+            s = stock[i]
+            if s == 0:
+                out[i] = 0
+            elif s <= minimo[i]:
+                out[i] = 1
+            elif s <= reorden[i]:
+                out[i] = 2
+            else:
+                out[i] = 3
+
+def claves_enteras(inventario, tabla, clave):
+    """
+    Normalizar una clave de join a int32 en ambos lados; si el parser la dejó
+    como texto se factoriza sobre la unión de valores
+    
+    Args:
+        inventario (pd.DataFrame): Tabla principal (se modifica en sitio)
+        tabla (pd.DataFrame): Tabla de búsqueda
+        clave (str): Columna de join
+        
+    Returns:
+        pd.DataFrame: Tabla de búsqueda con la clave entera
+    """
+    izquierda, derecha = inventario[clave], tabla[clave]
+    
+    if pd.api.types.is_integer_dtype(izquierda) and pd.api.types.is_integer_dtype(derecha):
+        inventario[clave] = izquierda.astype('int32')
+        tabla[clave] = derecha.astype('int32')
+    else:
+        codigos, _ = pd.factorize(pd.concat([izquierda, derecha], ignore_index=True))
+        inventario[clave] = codigos[:len(izquierda)].astype('int32')
+        tabla[clave] = codigos[len(izquierda):].astype('int32')
+    
+    assert inventario[clave].dtype == 'int32' and tabla[clave].dtype == 'int32'
+    return tabla
+
+def proyectar_columnas(df):
+    """Quedarse solo con COLUMNAS_USADAS (las que existan en df)"""
+    return df[[col for col in COLUMNAS_USADAS if col in df.columns]]
+
+def compactar_tipos(df):
+    """
+    Reducir el ancho de las columnas numéricas y categorizar textos repetidos
+    
+    Args:
+        df (pd.DataFrame): DataFrame cargado
+        
+    Returns:
+        pd.DataFrame: DataFrame con tipos compactos
+    """
+    if df.empty:
+        return df
+    
+    # Los enteros con nulos no caben en int32 sin máscara: se dejan como están
+    tipos = {
+        col: tipo for col, tipo in TIPOS_COMPACTOS.items()
+        if col in df.columns and not (tipo.startswith('int') and df[col].isna().any())
+    }
+    df = df.astype(tipos)
+    
+    for col in COLUMNAS_CATEGORICAS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    
+    return df
+
 @st.cache_data
 def process_data(df):
     """
@@ -276,70 +526,136 @@ def process_data(df):
     date_columns = ['fecha_ultima_compra', 'fecha_ultima_venta', 'fecha_creacion']
     for col in date_columns:
         if col in df.columns:
-            df[col] = pd.to_datetime(df[col], errors='coerce')
+            # Fechas ISO (YYYY-MM-DD[ HH:MM:SS]) por la ruta rápida, sin inferir por valor
+            df[col] = pd.to_datetime(df[col], format='ISO8601', errors='coerce')
     
-    # Calcular métricas adicionales
-    df['utilidad_unitaria'] = df['precio_venta'] - df['costo_unitario']
-    df['margen_porcentaje'] = (df['utilidad_unitaria'] / df['precio_venta'] * 100).round(2)
-    df['utilidad_mes'] = df['utilidad_unitaria'] * df['ventas_mes_actual']
-    df['valor_inventario'] = df['stock_actual'] * df['costo_unitario']
-    
-    # Rotación de inventario
-    df['rotacion_mensual'] = np.where(
-        df['stock_actual'] > 0, 
-        df['ventas_mes_actual'] / df['stock_actual'], 
-        0
-    )
-    df['meses_inventario'] = np.where(
-        df['ventas_mes_actual'] > 0,
-        df['stock_actual'] / df['ventas_mes_actual'],
-        999
-    )
+    # Desde PostgreSQL las métricas ya vienen calculadas (mv_inventario_enriquecido)
+    if 'estado_stock' in df.columns:
+        df['estado_stock'] = pd.Categorical(
+            df['estado_stock'].map(ESTADOS_STOCK_BD),
+            categories=ESTADOS_STOCK
+        )
+        return precalcular_conteos(df)
     
-    # Estado del stock
-    def clasificar_stock(row):
-        if row['stock_actual'] == 0:
-            return '🔴 SIN STOCK'
-        elif row['stock_actual'] <= row['stock_minimo']:
-            return '🟠 CRÍTICO'
-        elif row['stock_actual'] <= row['punto_reorden']:
-            return '🟡 BAJO'
-        else:
-            return '🟢 NORMAL'
+    # Calcular métricas adicionales
+    entradas = ['precio_venta', 'costo_unitario', 'stock_actual', 'ventas_mes_actual', 'ventas_mes_anterior']
+    if NUMBA_AVAILABLE and [str(df[col].dtype) for col in entradas] == [TIPOS_COMPACTOS[col] for col in entradas]:
+        # Una sola pasada compilada sobre las columnas ya compactadas
+        (
+            df['utilidad_unitaria'], df['margen_porcentaje'], df['utilidad_mes'],
+            df['valor_inventario'], df['rotacion_mensual'], df['meses_inventario'],
+            df['crecimiento_pct']
+        ) = metricas_inventario(*(df[col].to_numpy() for col in entradas))
+        df['margen_porcentaje'] = df['margen_porcentaje'].round(2)
+    else:
+        df['utilidad_unitaria'] = df['precio_venta'] - df['costo_unitario']
+        df['margen_porcentaje'] = (df['utilidad_unitaria'] / df['precio_venta'] * 100).round(2)
+        df['utilidad_mes'] = df['utilidad_unitaria'] * df['ventas_mes_actual']
+        df['valor_inventario'] = df['stock_actual'] * df['costo_unitario']
+        
+        # Rotación de inventario
+        df['rotacion_mensual'] = np.where(
+            df['stock_actual'] > 0, 
+            df['ventas_mes_actual'] / df['stock_actual'], 
+            0
+        )
+        df['meses_inventario'] = np.where(
+            df['ventas_mes_actual'] > 0,
+            df['stock_actual'] / df['ventas_mes_actual'],
+            999
+        )
+        
+        # Crecimiento de ventas
+        df['crecimiento_pct'] = np.where(
+            df['ventas_mes_anterior'] > 0,
+            ((df['ventas_mes_actual'] - df['ventas_mes_anterior']) / df['ventas_mes_anterior'] * 100),
+            0
+        )
     
-    df['estado_stock'] = df.apply(clasificar_stock, axis=1)
+    # Estado del stock como código int8 (índice en ESTADOS_STOCK, primera condición que se cumple)
+    stock = df['stock_actual'].to_numpy()
+    minimo = df['stock_minimo'].to_numpy()
+    reorden = df['punto_reorden'].to_numpy()
+    codigos = np.empty(len(df), dtype=np.int8)
+    if NUMBA_AVAILABLE:
+        clasificar_stock(stock, minimo, reorden, codigos)
+    else:
+        codigos[:] = np.select([stock == 0, stock <= minimo, stock <= reorden], [0, 1, 2], default=3)
+    df['estado_stock'] = pd.Categorical.from_codes(codigos, categories=ESTADOS_STOCK)
     
-    # Crecimiento de ventas
-    df['crecimiento_pct'] = np.where(
-        df['ventas_mes_anterior'] > 0,
-        ((df['ventas_mes_actual'] - df['ventas_mes_anterior']) / df['ventas_mes_anterior'] * 100),
-        0
-    )
+    return precalcular_conteos(df)
+
+def contar_activos(df):
+    """Número de productos activos (todos si no hay columna activo)"""
+    if 'activo' in df.columns:
+        return int(df['activo'].to_numpy().sum())
+    return len(df)
+
+def precalcular_conteos(df):
+    """
+    Guardar en df.attrs los conteos que se consultan en cada rerun
     
+    Args:
+        df (pd.DataFrame): DataFrame procesado
+        
+    Returns:
+        pd.DataFrame: El mismo DataFrame con attrs actualizados
+    """
+    df.attrs['n_activos'] = contar_activos(df)
+    df.attrs['n_criticos'] = int(mascara_criticos(df).sum())
     return df
 
+def mascara_criticos(df):
+    """Máscara de productos sin stock o en estado crítico (códigos 0 y 1 de ESTADOS_STOCK)"""
+    codigos = df['estado_stock'].cat.codes.to_numpy()
+    return (codigos == 0) | (codigos == 1)
+
 # ================================
 # FUNCIONES DE ANÁLISIS
 # ================================
 
+def mascara_categoria(serie, valor):
+    """
+    Máscara booleana de igualdad comparando códigos enteros si la serie es categórica
+    
+    Args:
+        serie (pd.Series): Columna a filtrar
+        valor: Valor buscado
+        
+    Returns:
+        np.ndarray: Máscara booleana
+    """
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        categorias = serie.cat.categories
+        if valor not in categorias:
+            return np.zeros(len(serie), dtype=bool)
+        return serie.cat.codes.to_numpy() == categorias.get_loc(valor)
+    return (serie == valor).to_numpy()
+
 def calculate_kpis(df):
     """Calcular KPIs principales del negocio"""
     if df.empty:
         return {}
     
     total_productos = len(df)
-    productos_activos = len(df[df.get('activo', True) == True])
-    productos_criticos = len(df[df['estado_stock'].isin(['🔴 SIN STOCK', '🟠 CRÍTICO'])])
+    productos_activos = df.attrs['n_activos'] if 'n_activos' in df.attrs else contar_activos(df)
+    
+    productos_criticos = df.attrs['n_criticos'] if 'n_criticos' in df.attrs else int(mascara_criticos(df).sum())
     
+    # Productos escalares en float64 para no acumular en float32
+    ventas = df['ventas_mes_actual'].to_numpy(dtype=np.float64)
     valor_total_inventario = df['valor_inventario'].sum()
-    ingresos_mes = (df['ventas_mes_actual'] * df['precio_venta']).sum()
-    costos_mes = (df['ventas_mes_actual'] * df['costo_unitario']).sum()
+    ingresos_mes = float(np.dot(ventas, df['precio_venta'].to_numpy(dtype=np.float64)))
+    costos_mes = float(np.dot(ventas, df['costo_unitario'].to_numpy(dtype=np.float64)))
     utilidad_mes = ingresos_mes - costos_mes
     margen_promedio = df['margen_porcentaje'].mean()
     
     # Métricas de eficiencia
-    rotacion_promedio = df[df['rotacion_mensual'] > 0]['rotacion_mensual'].mean()
-    productos_sin_movimiento = len(df[df['ventas_mes_actual'] == 0])
+    rotacion = df['rotacion_mensual'].to_numpy()
+    rotacion_positiva = rotacion[rotacion > 0]
+    rotacion_promedio = rotacion_positiva.mean() if rotacion_positiva.size else np.nan
+    productos_sin_movimiento = int((ventas == 0).sum())
+    top_growth_count = int((df['crecimiento_pct'].to_numpy() > 50).sum())
     
     return {
         'total_productos': total_productos,
@@ -353,15 +669,89 @@ def calculate_kpis(df):
         'margen_promedio': margen_promedio,
         'margen_neto': (utilidad_mes / ingresos_mes * 100) if ingresos_mes > 0 else 0,
         'rotacion_promedio': rotacion_promedio if not pd.isna(rotacion_promedio) else 0,
-        'productos_sin_movimiento': productos_sin_movimiento
+        'productos_sin_movimiento': productos_sin_movimiento,
+        'top_growth_count': top_growth_count
     }
 
-def generate_insights(df, kpis):
+def top_n(df, columna, n):
+    """
+    Las n filas con mayor valor en una columna, por selección parcial
+    
+    Args:
+        df (pd.DataFrame): Datos
+        columna (str): Columna numérica a ordenar
+        n (int): Número de filas
+        
+    Returns:
+        pd.DataFrame: Filas seleccionadas en orden descendente
+    """
+    valores = df[columna].to_numpy()
+    if len(valores) <= n:
+        return df.sort_values(columna, ascending=False)
+    
+    idx = np.argpartition(valores, -n)[-n:]
+    idx = idx[np.argsort(-valores[idx], kind='stable')]
+    return df.iloc[idx]
+
+@st.cache_data(ttl=300)
+def resumen_categorias(clave, _df):
+    """
+    Performance por categoría, en caché mientras no cambien los filtros
+    
+    Args:
+        clave (tuple): Filtros activos y número de filas de _df
+        _df (pd.DataFrame): Datos filtrados (excluidos del hash)
+        
+    Returns:
+        pd.DataFrame: Resumen por categoría ordenado por utilidad
+    """
+    # Sumas por código de categoría con bincount (una pasada por columna, sin groupby)
+    categorias = _df['nombre_categoria'].cat.categories
+    codigos = _df['nombre_categoria'].cat.codes.to_numpy()
+    validos = codigos >= 0
+    codigos = codigos[validos]
+    
+    def sumar(columna):
+        valores = _df[columna].to_numpy(dtype=np.float64)[validos]
+        return np.bincount(codigos, weights=np.nan_to_num(valores), minlength=len(categorias))
+    
+    productos = np.bincount(codigos, minlength=len(categorias))
+    margen = _df['margen_porcentaje'].to_numpy(dtype=np.float64)[validos]
+    margen_n = np.bincount(codigos, weights=~np.isnan(margen), minlength=len(categorias))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        margen_medio = np.bincount(codigos, weights=np.nan_to_num(margen), minlength=len(categorias)) / margen_n
+    
+    categoria_analysis = pd.DataFrame({
+        'Ventas (Un)': sumar('ventas_mes_actual').astype(np.int64),
+        'Utilidad (Q)': sumar('utilidad_mes'),
+        'Valor Inv (Q)': sumar('valor_inventario'),
+        'Productos': productos,
+        'Margen %': margen_medio
+    }, index=pd.Index(categorias, name='nombre_categoria'))
+    
+    # Solo categorías presentes en la selección, como groupby(observed=True)
+    categoria_analysis = categoria_analysis[productos > 0].round(2)
+    return categoria_analysis.sort_values('Utilidad (Q)', ascending=False)
+
+@st.cache_data(ttl=300)
+def conteo_estados(clave, _df):
     """
-    Generar insights automáticos del negocio
+    Distribución de productos por estado de stock, en caché por filtros
+    
+    Args:
+        clave (tuple): Filtros activos y número de filas de _df
+        _df (pd.DataFrame): Datos filtrados (excluidos del hash)
+        
+    Returns:
+        pd.Series: Conteo por estado
+    """
+    return _df['estado_stock'].value_counts()
+
+def generate_insights(kpis):
+    """
+    Generar insights automáticos del negocio a partir de los KPIs
     
     Args:
-        df (pd.DataFrame): Datos procesados
         kpis (dict): KPIs calculados
         
     Returns:
@@ -413,15 +803,13 @@ def generate_insights(df, kpis):
         })
     
     # Oportunidades de crecimiento
-    if not df.empty:
-        top_growth = df[df['crecimiento_pct'] > 50]
-        if len(top_growth) > 0:
-            insights.append({
-                'tipo': 'success',
-                'titulo': '🚀 Productos con Alto Crecimiento',
-                'mensaje': f'{len(top_growth)} productos con crecimiento >50%. Oportunidad de incrementar stock.',
-                'prioridad': 'info'
-            })
+    if kpis.get('top_growth_count', 0) > 0:
+        insights.append({
+            'tipo': 'success',
+            'titulo': '🚀 Productos con Alto Crecimiento',
+            'mensaje': f'{kpis["top_growth_count"]} productos con crecimiento >50%. Oportunidad de incrementar stock.',
+            'prioridad': 'info'
+        })
     
     return insights
 
@@ -509,16 +897,21 @@ def render_sidebar_info(df, es_db):
     
     if not df.empty:
         total_valor = df['valor_inventario'].sum()
-        productos_activos = len(df[df.get('activo', True) == True])
+        productos_activos = df.attrs['n_activos'] if 'n_activos' in df.attrs else contar_activos(df)
         
-        st.sidebar.metric("💰 Valor Total", f"Q{total_valor:,.2f}")
-        st.sidebar.metric("📦 Productos Activos", productos_activos)
+        col1, col2 = st.sidebar.columns(2)
+        col1.metric("💰 Valor Total", f"Q{total_valor:,.2f}")
+        col2.metric("📦 Productos Activos", productos_activos)
         
-        # Distribución por estado
-        estado_counts = df['estado_stock'].value_counts()
+        # Distribución por estado (una sola tabla en lugar de una línea por estado)
+        # Misma forma de clave que clave_filtros en main (fuente y momento de carga incluidos)
+        clave = (es_db, df.attrs.get('cargado'), 'Todas', 'Todos', len(df))
+        estado_counts = conteo_estados(clave, df)
         st.sidebar.markdown("**Estado del Stock:**")
-        for estado, count in estado_counts.items():
-            st.sidebar.write(f"{estado}: {count}")
+        st.sidebar.dataframe(
+            estado_counts.rename('Cant.').to_frame(),
+            use_container_width=True
+        )
     
     # Información del desarrollador
     st.sidebar.markdown("---")
@@ -579,12 +972,26 @@ def main():
     proveedores_disponibles = ['Todos'] + sorted(df['nombre_proveedor'].dropna().unique().tolist())
     proveedor_filtro = st.sidebar.selectbox("🏢 Filtrar por Proveedor", proveedores_disponibles)
     
-    # Aplicar filtros
-    df_filtered = df.copy()
+    # Aplicar filtros (una sola máscara sobre los códigos categóricos)
+    mask = np.ones(len(df), dtype=bool)
     if categoria_filtro != 'Todas':
-        df_filtered = df_filtered[df_filtered['nombre_categoria'] == categoria_filtro]
+        mask &= mascara_categoria(df['nombre_categoria'], categoria_filtro)
     if proveedor_filtro != 'Todos':
-        df_filtered = df_filtered[df_filtered['nombre_proveedor'] == proveedor_filtro]
+        mask &= mascara_categoria(df['nombre_proveedor'], proveedor_filtro)
+    # Sin filtros activos se reutiliza el mismo DataFrame
+    if mask.all():
+        df_filtered = df
+    else:
+        df_filtered = df.iloc[mask]
+        df_filtered.attrs = {}
+        precalcular_conteos(df_filtered)
+    
+    # Clave barata para los agregados en caché de esta selección; la fuente
+    # y el momento de carga evitan reutilizar agregados de datos anteriores
+    clave_filtros = (
+        es_db, df.attrs.get('cargado'),
+        categoria_filtro, proveedor_filtro, len(df_filtered)
+    )
     
     # Calcular KPIs
     kpis = calculate_kpis(df_filtered)
@@ -595,7 +1002,7 @@ def main():
     st.markdown("---")
     
     # Generar y mostrar insights
-    insights = generate_insights(df_filtered, kpis)
+    insights = generate_insights(kpis)
     if insights:
         render_insights(insights)
         st.markdown("---")
@@ -616,7 +1023,7 @@ def main():
         with col1:
             st.subheader("🏆 Top 10 Productos por Ventas")
             if not df_filtered.empty:
-                top_ventas = df_filtered.nlargest(10, 'ventas_mes_actual')
+                top_ventas = top_n(df_filtered, 'ventas_mes_actual', 10)
                 
                 fig_top = px.bar(
                     top_ventas, 
@@ -634,7 +1041,7 @@ def main():
         with col2:
             st.subheader("📊 Estado del Inventario")
             if not df_filtered.empty:
-                stock_dist = df_filtered['estado_stock'].value_counts()
+                stock_dist = conteo_estados(clave_filtros, df_filtered)
                 
                 colors = {
                     '🟢 NORMAL': '#22c55e',
@@ -656,16 +1063,7 @@ def main():
         # Análisis por categoría
         st.subheader("📂 Performance por Categoría")
         if not df_filtered.empty:
-            categoria_analysis = df_filtered.groupby('nombre_categoria').agg({
-                'ventas_mes_actual': 'sum',
-                'utilidad_mes': 'sum',
-                'valor_inventario': 'sum',
-                'producto_id': 'count',
-                'margen_porcentaje': 'mean'
-            }).round(2)
-            
-            categoria_analysis.columns = ['Ventas (Un)', 'Utilidad (Q)', 'Valor Inv (Q)', 'Productos', 'Margen %']
-            categoria_analysis = categoria_analysis.sort_values('Utilidad (Q)', ascending=False)
+            categoria_analysis = resumen_categorias(clave_filtros, df_filtered)
             
             st.dataframe(categoria_analysis, use_container_width=True)
     
@@ -674,7 +1072,7 @@ def main():
         st.subheader("🚨 Control y Alertas del Sistema")
         
         # Productos críticos
-        productos_criticos = df_filtered[df_filtered['estado_stock'].isin(['🔴 SIN STOCK', '🟠 CRÍTICO'])]
+        productos_criticos = df_filtered.iloc[mascara_criticos(df_filtered)]
         
         if not productos_criticos.empty:
             col1, col2 = st.columns([3, 1])
@@ -1,13 +1,121 @@
+import os
+import hashlib
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
+from plotly.colors import diverging
 import numpy as np
 from datetime import datetime, timedelta
 import warnings
 warnings.filterwarnings('ignore')
 
+# Kernels compilados para ABC y predicción (opcional)
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# Copias Parquet de los CSV para cargas sin parseo (opcional)
+try:
+    import pyarrow  # noqa: F401
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+# Fragmentos de Streamlit (st.fragment desde 1.37; antes experimental_fragment).
+# En versiones sin soporte la función se ejecuta como parte del script completo.
+fragment = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None) or (lambda func: func)
+
+# Estados de stock, de mayor a menor severidad
+ESTADOS_STOCK = ['🔴 SIN STOCK', '🟠 CRÍTICO', '🟡 BAJO', '🟢 NORMAL']
+
+# Paletas de gráficos (se resuelven una sola vez, no en cada rerun)
+COLORES_STOCK = ['#ef4444', '#f97316', '#eab308', '#22c55e']  # alineados con ESTADOS_STOCK
+COLORES_ABC = ['#ef4444', '#f97316', '#22c55e']  # alineados con CLASES_ABC
+ESCALA_RDYLGN = diverging.RdYlGn
+
+# Tipos numéricos compactos para las columnas de inventario
+TIPOS_COMPACTOS = {
+    'producto_id': 'int32',
+    'stock_actual': 'int32',
+    'stock_minimo': 'int32',
+    'punto_reorden': 'int32',
+    'ventas_mes_actual': 'int32',
+    'ventas_mes_anterior': 'int32',
+    'ventas_trimestre': 'int32',
+    'costo_unitario': 'float32',
+    'precio_venta': 'float32'
+}
+
+# Tipos de las tablas de búsqueda (claves de join int32, igual que en el inventario)
+TIPOS_TABLAS = {
+    'data/categorias.csv': {'categoria_id': 'int32', 'margen_promedio': 'float32', 'activo': 'bool'},
+    'data/proveedores.csv': {'proveedor_id': 'int32', 'tiempo_entrega_dias': 'int32', 'calificacion': 'float32', 'activo': 'bool'},
+    'data/ubicaciones.csv': {'ubicacion_id': 'int32', 'nivel': 'int32', 'capacidad_maxima': 'int32'}
+}
+CLAVES_INVENTARIO = {'categoria_id': 'int32', 'proveedor_id': 'int32', 'ubicacion_id': 'int32'}
+
+# Directorio de las copias Parquet (compartido con app.py, prefijo propio)
+CACHE_DIR = 'cache'
+
+# Versión del formato de las copias Parquet: subir si cambia la forma de leer
+# las tablas sin que cambien sus tipos (los tipos ya forman parte del nombre)
+VERSION_COPIAS = 1
+
+# Métricas derivadas que se guardan en float32 (solo razones; los montos
+# en quetzales quedan en float64 para que los totales no pierdan centavos)
+METRICAS_FLOAT32 = ['utilidad_unitaria', 'margen_porcentaje', 'rotacion_mensual']
+
+# Filas por página en los reportes de tabla completa
+TAMANO_PAGINA = 100
+
+# Clases del análisis ABC por ingresos acumulados
+CLASES_ABC = ['A - Vital (80% ingresos)', 'B - Importante (15% ingresos)', 'C - Normal (5% ingresos)']
+
+# Clases de rotación por meses de inventario
+CLASES_ROTACION = ['🟢 Excelente (<1 mes)', '🟡 Buena (1-2 meses)', '🟠 Regular (2-3 meses)', '🔴 Lenta (>3 meses)']
+
+# Estados de riesgo de la predicción de demanda
+RIESGOS_DEMANDA = ['⚠️ RIESGO DESABASTO', '🟡 STOCK AJUSTADO', '🟢 STOCK SUFICIENTE']
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def abc_kernel(ingresos, acumulado, porcentaje, codigos):
+        """Ingresos acumulados, porcentaje y código ABC (0 A, 1 B, 2 C) sobre ingresos ya ordenados"""
+        total = ingresos.sum()
+        acc = 0.0
+        for i in range(ingresos.shape[0]):
+            acc += ingresos[i]
+            acumulado[i] = acc
+            pct = acc / total * 100.0 if total > 0 else np.nan
+            porcentaje[i] = pct
+            if pct <= 80:
+                codigos[i] = 0
+            elif pct <= 95:
+                codigos[i] = 1
+            else:
+                codigos[i] = 2
+    
+    @njit(cache=True)
+    def prediccion_kernel(actual, anterior, stock, crecimiento, proyeccion, riesgo, compra):
+        """Crecimiento, proyección, código de riesgo y compra sugerida por fila"""
+        for i in range(actual.shape[0]):
+            if anterior[i] > 0:
+                crecimiento[i] = (actual[i] - anterior[i]) / anterior[i] * 100.0
+                proyeccion[i] = int(np.rint(actual[i] * (1 + crecimiento[i] / 100.0)))
+            else:
+                crecimiento[i] = 0.0
+                proyeccion[i] = actual[i]
+            if stock[i] < proyeccion[i]:
+                riesgo[i] = 0
+            elif stock[i] < proyeccion[i] * 1.5:
+                riesgo[i] = 1
+            else:
+                riesgo[i] = 2
+            compra[i] = max(0, proyeccion[i] - stock[i])
+
 # ================================
 # CONFIGURACIÓN INICIAL
 # ================================
@@ -61,15 +169,63 @@ st.markdown("""
 # FUNCIONES DE CARGA DE DATOS
 # ================================
 
+def leer_csv(ruta, tipos):
+    """
+    Leer un CSV con tipos explícitos; si hay una copia Parquet al día en
+    cache/ se lee esa (sin tokenizar texto) y si no, se crea tras el parseo
+    
+    Args:
+        ruta (str): Ruta del CSV
+        tipos (dict): Tipos por columna
+        
+    Returns:
+        pd.DataFrame: Tabla leída
+    """
+    if not PARQUET_AVAILABLE:
+        return pd.read_csv(ruta, dtype=tipos)
+    
+    # El nombre incluye el esquema: cambiar los tipos invalida la copia
+    prefijo = f"tabla_{os.path.splitext(os.path.basename(ruta))[0]}_"
+    esquema = hashlib.sha1(repr((VERSION_COPIAS, sorted(tipos.items()))).encode('utf-8')).hexdigest()[:12]
+    copia = os.path.join(CACHE_DIR, f"{prefijo}{esquema}.parquet")
+    if os.path.exists(copia) and os.path.getmtime(copia) >= os.path.getmtime(ruta):
+        try:
+            return pd.read_parquet(copia, engine='pyarrow')
+        except Exception:
+            # Copia ilegible: se regenera desde el CSV
+            pass
+    
+    df = pd.read_csv(ruta, dtype=tipos)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Escribir aparte y reemplazar atómicamente: otra sesión nunca
+        # lee una copia a medio escribir
+        temporal = f"{copia}.{os.getpid()}.tmp"
+        df.to_parquet(temporal, engine='pyarrow', compression='zstd')
+        os.replace(temporal, copia)
+        
+        # Descartar copias de esquemas anteriores de la misma tabla
+        for archivo in os.listdir(CACHE_DIR):
+            ruta_copia = os.path.join(CACHE_DIR, archivo)
+            if archivo.startswith(prefijo) and archivo.endswith('.parquet') and ruta_copia != copia:
+                try:
+                    os.remove(ruta_copia)
+                except OSError:
+                    pass
+    except OSError:
+        # Sin permisos de escritura: se sigue sin copia
+        pass
+    return df
+
 @st.cache_data
 def load_data():
     """Carga todos los datasets necesarios"""
     try:
-        # Cargar datos principales
-        inventario = pd.read_csv('data/inventario_expandido.csv')
-        categorias = pd.read_csv('data/categorias.csv')
-        proveedores = pd.read_csv('data/proveedores.csv')
-        ubicaciones = pd.read_csv('data/ubicaciones.csv')
+        # Cargar datos principales (tipos explícitos: el parser no tiene que inferirlos)
+        inventario = leer_csv('data/inventario_expandido.csv', {**TIPOS_COMPACTOS, **CLAVES_INVENTARIO})
+        categorias, proveedores, ubicaciones = (
+            leer_csv(ruta, tipos) for ruta, tipos in TIPOS_TABLAS.items()
+        )
         
         # Datos opcionales
         try:
@@ -84,6 +240,10 @@ def load_data():
         df = df.merge(proveedores, on='proveedor_id', how='left')
         df = df.merge(ubicaciones, on='ubicacion_id', how='left')
         
+        # Textos repetidos de filtros y agrupaciones como categóricos
+        for col in ('nombre_categoria', 'nombre_proveedor'):
+            df[col] = df[col].astype('category')
+        
         # Conversiones de tipos
         date_columns = ['fecha_ultima_compra', 'fecha_ultima_venta', 'fecha_creacion']
         for col in date_columns:
@@ -95,22 +255,25 @@ def load_data():
         df['margen_porcentaje'] = (df['utilidad_unitaria'] / df['precio_venta'] * 100).round(2)
         df['utilidad_mes'] = df['utilidad_unitaria'] * df['ventas_mes_actual']
         df['valor_inventario'] = df['stock_actual'] * df['costo_unitario']
+        df['ingresos_producto'] = df['ventas_mes_actual'] * df['precio_venta']
+        df['costo_total_mes'] = df['ventas_mes_actual'] * df['costo_unitario']
         df['rotacion_mensual'] = np.where(df['stock_actual'] > 0, 
                                         df['ventas_mes_actual'] / df['stock_actual'], 
                                         0)
-        
-        # Estado del stock
-        def clasificar_stock(row):
-            if row['stock_actual'] == 0:
-                return '🔴 SIN STOCK'
-            elif row['stock_actual'] <= row['stock_minimo']:
-                return '🟠 CRÍTICO'
-            elif row['stock_actual'] <= row['punto_reorden']:
-                return '🟡 BAJO'
-            else:
-                return '🟢 NORMAL'
-        
-        df['estado_stock'] = df.apply(clasificar_stock, axis=1)
+        # int32 * float32 promueve a float64: las razones vuelven a 4 bytes
+        df = df.astype({col: 'float32' for col in METRICAS_FLOAT32})
+        
+        # Estado del stock (vectorizado, primera condición que se cumple)
+        stock = df['stock_actual'].to_numpy()
+        condiciones = [
+            stock == 0,
+            stock <= df['stock_minimo'].to_numpy(),
+            stock <= df['punto_reorden'].to_numpy()
+        ]
+        df['estado_stock'] = pd.Categorical(
+            np.select(condiciones, ESTADOS_STOCK[:3], default=ESTADOS_STOCK[3]),
+            categories=ESTADOS_STOCK
+        )
         
         return df, alertas, movimientos
         
@@ -129,7 +292,7 @@ def calculate_kpis(df):
     productos_criticos = len(df[df['estado_stock'].isin(['🔴 SIN STOCK', '🟠 CRÍTICO'])])
     
     valor_total_inventario = df['valor_inventario'].sum()
-    ingresos_mes = (df['ventas_mes_actual'] * df['precio_venta']).sum()
+    ingresos_mes = df['ingresos_producto'].sum()
     utilidad_mes = df['utilidad_mes'].sum()
     margen_promedio = df['margen_porcentaje'].mean()
     
@@ -144,37 +307,312 @@ def calculate_kpis(df):
         'pct_productos_criticos': (productos_criticos / total_productos * 100) if total_productos > 0 else 0
     }
 
+def top_n(df, columna, n):
+    """Las n filas con mayor valor en una columna, por selección parcial"""
+    valores = df[columna].to_numpy()
+    if len(valores) <= n:
+        return df.sort_values(columna, ascending=False)
+    
+    idx = np.argpartition(valores, -n)[-n:]
+    idx = idx[np.argsort(-valores[idx], kind='stable')]
+    return df.iloc[idx]
+
+def paginar(df, key):
+    """
+    Mostrar solo una página de una tabla grande
+    
+    Args:
+        df (pd.DataFrame): Tabla completa (ya ordenada)
+        key (str): Clave única del selector de página
+        
+    Returns:
+        pd.DataFrame: Filas de la página seleccionada
+    """
+    total_paginas = max(1, -(-len(df) // TAMANO_PAGINA))
+    if total_paginas == 1:
+        return df
+    
+    pagina = st.number_input(
+        f"Página (de {total_paginas}, {len(df):,} filas)",
+        min_value=1, max_value=total_paginas, value=1, step=1, key=key
+    )
+    inicio = (pagina - 1) * TAMANO_PAGINA
+    return df.iloc[inicio:inicio + TAMANO_PAGINA]
+
 def predict_demand(df):
     """Predicción simple de demanda basada en tendencia"""
     df_pred = df.copy()
+    actual = df_pred['ventas_mes_actual'].to_numpy()
+    anterior = df_pred['ventas_mes_anterior'].to_numpy()
+    stock = df_pred['stock_actual'].to_numpy()
+    
+    if NUMBA_AVAILABLE:
+        n = len(df_pred)
+        crecimiento = np.empty(n, dtype=np.float64)
+        proyeccion = np.empty(n, dtype=np.int64)
+        riesgo = np.empty(n, dtype=np.int8)
+        compra = np.empty(n, dtype=np.int64)
+        prediccion_kernel(actual, anterior, stock, crecimiento, proyeccion, riesgo, compra)
+    else:
+        # Calcular crecimiento mensual
+        con_base = anterior > 0
+        crecimiento = np.where(con_base, (actual - anterior) / np.where(con_base, anterior, 1) * 100, 0.0)
+        
+        # Proyección próximo mes
+        proyeccion = np.where(con_base, actual * (1 + crecimiento / 100), actual).round(0).astype(np.int64)
+        
+        # Evaluación de riesgo (vectorizada, primera condición que se cumple)
+        riesgo = np.select([stock < proyeccion, stock < proyeccion * 1.5], [0, 1], default=2).astype(np.int8)
+        compra = np.maximum(0, proyeccion - stock)
+    
+    df_pred['crecimiento_pct'] = crecimiento
+    df_pred['proyeccion_siguiente_mes'] = proyeccion
+    df_pred['riesgo_futuro'] = pd.Categorical.from_codes(riesgo, categories=RIESGOS_DEMANDA)
+    df_pred['compra_sugerida'] = compra
     
-    # Calcular crecimiento mensual
-    df_pred['crecimiento_pct'] = np.where(
-        df_pred['ventas_mes_anterior'] > 0,
-        ((df_pred['ventas_mes_actual'] - df_pred['ventas_mes_anterior']) / df_pred['ventas_mes_anterior'] * 100),
-        0
+    return df_pred
+
+# ================================
+# AGREGADOS EN CACHÉ POR SELECCIÓN DE FILTROS
+# ================================
+# Streamlit re-ejecuta el script completo en cada interacción; estas funciones
+# reciben la clave de filtros (hashable) y el DataFrame con prefijo "_" para
+# que Streamlit no lo hashee. Los datos base son estáticos (load_data).
+
+@st.cache_data
+def get_filtered(clave, _df):
+    """Aplicar filtros de sidebar; clave = (categoría, proveedor, estados)"""
+    categoria_filtro, proveedor_filtro, estado_stock_filtro = clave
+    
+    # Una sola máscara combinada y una sola selección (sin copia previa)
+    mask = np.ones(len(_df), dtype=bool)
+    if categoria_filtro != 'Todas':
+        mask &= (_df['nombre_categoria'].to_numpy() == categoria_filtro)
+    if proveedor_filtro != 'Todos':
+        mask &= (_df['nombre_proveedor'].to_numpy() == proveedor_filtro)
+    if estado_stock_filtro:
+        mask &= _df['estado_stock'].isin(estado_stock_filtro).to_numpy()
+    
+    return _df.loc[mask]
+
+@st.cache_data
+def kpis_filtrados(clave, _df):
+    """KPIs principales de la selección"""
+    return calculate_kpis(_df)
+
+@st.cache_data
+def agregados_categoria(clave, _df_pred):
+    """
+    Todos los agregados por categoría en un solo groupby; de aquí salen la
+    tabla de la pestaña principal y las tendencias del análisis predictivo
+    """
+    return _df_pred.groupby('nombre_categoria', observed=True, sort=False).agg(
+        ventas=('ventas_mes_actual', 'sum'),
+        ventas_ant=('ventas_mes_anterior', 'sum'),
+        utilidad=('utilidad_mes', 'sum'),
+        valor=('valor_inventario', 'sum'),
+        productos=('producto_id', 'count'),
+        crecimiento=('crecimiento_pct', 'mean')
     )
+
+def construir_abc(df_con_ventas):
+    """Clasificación ABC por ingresos (recibe solo productos con ventas)"""
+    df_abc = df_con_ventas.sort_values('ingresos_producto', ascending=False)
+    ingresos = df_abc['ingresos_producto'].to_numpy(dtype=np.float64)
+    
+    if NUMBA_AVAILABLE:
+        acumulado = np.empty_like(ingresos)
+        porcentaje = np.empty_like(ingresos)
+        codigos = np.empty(len(ingresos), dtype=np.int8)
+        abc_kernel(ingresos, acumulado, porcentaje, codigos)
+    else:
+        acumulado = ingresos.cumsum()
+        porcentaje = acumulado / ingresos.sum() * 100
+        # Clasificación ABC (vectorizada, primera condición que se cumple)
+        codigos = np.select([porcentaje <= 80, porcentaje <= 95], [0, 1], default=2).astype(np.int8)
+    
+    df_abc['ingresos_acumulados'] = acumulado
+    df_abc['porcentaje_acumulado'] = porcentaje
+    df_abc['clasificacion_abc'] = pd.Categorical.from_codes(codigos, categories=CLASES_ABC)
+    return df_abc
+
+@st.cache_data
+def analisis_proveedor(clave, _df):
+    """Tabla de performance por proveedor de la selección"""
+    proveedor_analysis = _df.groupby('nombre_proveedor', observed=True, sort=False).agg({
+        'ventas_mes_actual': 'sum',
+        'utilidad_mes': 'sum',
+        'valor_inventario': 'sum',
+        'margen_porcentaje': 'mean',
+        'producto_id': 'count'
+    }).round(2)
+    
+    proveedor_analysis.columns = ['Ventas (Un.)', 'Utilidad (Q)', 'Valor Inv. (Q)', 'Margen %', 'Productos']
+    return proveedor_analysis.sort_values('Utilidad (Q)', ascending=False)
+
+@st.cache_data
+def csv_bytes(clave, nombre, _df):
+    """CSV codificado para descarga, generado una vez por selección y reporte"""
+    return _df.to_csv(index=False).encode('utf-8')
+
+# ================================
+# PESTAÑAS CON RERUN PROPIO
+# ================================
+
+@fragment
+def render_reportes(df_filtered, df_con_ventas, df_abc, clave_filtros):
+    """
+    Pestaña de reportes detallados; al ser un fragmento, sus selectores y
+    descargas solo re-ejecutan esta pestaña
     
-    # Proyección próximo mes
-    df_pred['proyeccion_siguiente_mes'] = np.where(
-        df_pred['ventas_mes_anterior'] > 0,
-        df_pred['ventas_mes_actual'] * (1 + df_pred['crecimiento_pct'] / 100),
-        df_pred['ventas_mes_actual']
-    ).round(0).astype(int)
-    
-    # Evaluación de riesgo
-    def evaluar_riesgo(row):
-        if row['stock_actual'] < row['proyeccion_siguiente_mes']:
-            return '⚠️ RIESGO DESABASTO'
-        elif row['stock_actual'] < row['proyeccion_siguiente_mes'] * 1.5:
-            return '🟡 STOCK AJUSTADO'
+    Args:
+        df_filtered (pd.DataFrame): Inventario filtrado
+        df_con_ventas (pd.DataFrame): Productos filtrados con ventas este mes
+        df_abc (pd.DataFrame): Clasificación ABC de la selección
+        clave_filtros (tuple): Clave de la selección de filtros
+    """
+    st.subheader("📋 Reportes Detallados del Inventario")
+    
+    # Selector de tipo de reporte
+    tipo_reporte = st.selectbox(
+        "📊 Seleccionar Tipo de Reporte",
+        [
+            "Inventario Completo",
+            "Productos Más Vendidos",
+            "Análisis de Rotación",
+            "Productos Sin Movimiento",
+            "Reporte de Márgenes"
+        ]
+    )
+    
+    if tipo_reporte == "Inventario Completo":
+        st.markdown("### 📦 Inventario Completo")
+        
+        inventario_completo = df_filtered[[
+            'nombre', 'nombre_categoria', 'stock_actual', 'stock_minimo', 
+            'precio_venta', 'costo_unitario', 'margen_porcentaje',
+            'ventas_mes_actual', 'valor_inventario', 'estado_stock',
+            'nombre_proveedor'
+        ]].sort_values('valor_inventario', ascending=False)
+        
+        st.dataframe(paginar(inventario_completo, 'pagina_inventario'), use_container_width=True, hide_index=True)
+    
+    elif tipo_reporte == "Productos Más Vendidos":
+        st.markdown("### 🏆 Top Productos por Ventas")
+        
+        top_products = top_n(df_filtered, 'ventas_mes_actual', 20)[[
+            'nombre', 'ventas_mes_actual', 'ventas_mes_anterior',
+            'utilidad_mes', 'stock_actual', 'rotacion_mensual'
+        ]]
+        
+        st.dataframe(top_products, use_container_width=True, hide_index=True)
+    
+    elif tipo_reporte == "Análisis de Rotación":
+        st.markdown("### 🔄 Análisis de Rotación de Inventario")
+        
+        # Solo productos con ventas: los meses de inventario siempre están definidos
+        meses = df_con_ventas['stock_actual'].to_numpy() / df_con_ventas['ventas_mes_actual'].to_numpy()
+        
+        # Clasificar rotación (vectorizada)
+        rotacion_analysis = df_con_ventas.assign(
+            meses_inventario=meses,
+            clasificacion_rotacion=pd.Categorical(
+                np.select([meses < 1, meses < 2, meses < 3], CLASES_ROTACION[:3], default=CLASES_ROTACION[3]),
+                categories=CLASES_ROTACION
+            )
+        )
+        
+        rotacion_display = rotacion_analysis[[
+            'nombre', 'ventas_mes_actual', 'stock_actual', 'meses_inventario',
+            'clasificacion_rotacion', 'valor_inventario'
+        ]].sort_values('meses_inventario', ascending=False)
+        
+        st.dataframe(paginar(rotacion_display, 'pagina_rotacion'), use_container_width=True, hide_index=True)
+    
+    elif tipo_reporte == "Productos Sin Movimiento":
+        st.markdown("### 📉 Productos con Poco o Sin Movimiento")
+        
+        # El capital inmovilizado es el valor de inventario ya calculado en load_data
+        sin_movimiento = df_filtered[
+            (df_filtered['ventas_mes_actual'] <= 2) | 
+            (df_filtered['ventas_mes_actual'] == 0)
+        ].rename(columns={'valor_inventario': 'valor_inmovilizado'})
+        
+        if not sin_movimiento.empty:
+            sin_mov_display = sin_movimiento[[
+                'nombre', 'nombre_categoria', 'stock_actual', 'ventas_mes_actual',
+                'ventas_trimestre', 'valor_inmovilizado', 'fecha_ultima_venta'
+            ]].sort_values('valor_inmovilizado', ascending=False)
+            
+            st.dataframe(sin_mov_display, use_container_width=True, hide_index=True)
+            
+            total_inmovilizado = sin_movimiento['valor_inmovilizado'].sum()
+            st.warning(f"💰 **Capital inmovilizado total:** Q{total_inmovilizado:,.2f}")
         else:
-            return '🟢 STOCK SUFICIENTE'
+            st.success("🎉 ¡Todos los productos tienen movimiento activo!")
+    
+    elif tipo_reporte == "Reporte de Márgenes":
+        st.markdown("### 💹 Análisis de Márgenes de Utilidad")
+        
+        margenes_analysis = df_filtered.sort_values('margen_porcentaje', ascending=False)
+        
+        margenes_display = margenes_analysis[[
+            'nombre', 'costo_unitario', 'precio_venta', 'utilidad_unitaria',
+            'margen_porcentaje', 'ventas_mes_actual', 'utilidad_mes'
+        ]]
+        
+        st.dataframe(margenes_display, use_container_width=True, hide_index=True)
+        
+        # Estadísticas de márgenes
+        col1, col2, col3 = st.columns(3)
+        
+        with col1:
+            margen_promedio = margenes_analysis['margen_porcentaje'].mean()
+            st.metric("📊 Margen Promedio", f"{margen_promedio:.1f}%")
+        
+        with col2:
+            margen_maximo = margenes_analysis['margen_porcentaje'].max()
+            st.metric("📈 Margen Máximo", f"{margen_maximo:.1f}%")
+        
+        with col3:
+            margen_minimo = margenes_analysis['margen_porcentaje'].min()
+            st.metric("📉 Margen Mínimo", f"{margen_minimo:.1f}%")
     
-    df_pred['riesgo_futuro'] = df_pred.apply(evaluar_riesgo, axis=1)
-    df_pred['compra_sugerida'] = np.maximum(0, df_pred['proyeccion_siguiente_mes'] - df_pred['stock_actual'])
+    # Botones de descarga
+    st.markdown("---")
+    st.markdown("### 📥 Descargar Reportes")
     
-    return df_pred
+    col1, col2, col3 = st.columns(3)
+    
+    fecha = datetime.now().strftime('%Y%m%d')
+    
+    with col1:
+        st.download_button(
+            label="📊 Descargar Inventario Completo",
+            data=csv_bytes(clave_filtros, 'inventario', df_filtered),
+            file_name=f"inventario_completo_{fecha}.csv",
+            mime="text/csv"
+        )
+    
+    with col2:
+        productos_criticos_download = df_filtered[df_filtered['estado_stock'].isin(['🔴 SIN STOCK', '🟠 CRÍTICO'])]
+        if not productos_criticos_download.empty:
+            st.download_button(
+                label="⚠️ Descargar Productos Críticos",
+                data=csv_bytes(clave_filtros, 'criticos', productos_criticos_download),
+                file_name=f"productos_criticos_{fecha}.csv",
+                mime="text/csv"
+            )
+        else:
+            st.info("No hay productos críticos para descargar")
+    
+    with col3:
+        st.download_button(
+            label="📈 Descargar Análisis ABC",
+            data=csv_bytes(clave_filtros, 'abc', df_abc),
+            file_name=f"analisis_abc_{fecha}.csv",
+            mime="text/csv"
+        )
 
 # ================================
 # INTERFAZ PRINCIPAL
@@ -212,14 +650,38 @@ def main():
         default=['🟢 NORMAL', '🟡 BAJO', '🟠 CRÍTICO', '🔴 SIN STOCK']
     )
     
-    # Aplicar filtros
-    df_filtered = df.copy()
-    if categoria_filtro != 'Todas':
-        df_filtered = df_filtered[df_filtered['nombre_categoria'] == categoria_filtro]
-    if proveedor_filtro != 'Todos':
-        df_filtered = df_filtered[df_filtered['nombre_proveedor'] == proveedor_filtro]
-    if estado_stock_filtro:
-        df_filtered = df_filtered[df_filtered['estado_stock'].isin(estado_stock_filtro)]
+    # Aplicar filtros (en caché por selección)
+    clave_filtros = (categoria_filtro, proveedor_filtro, tuple(sorted(estado_stock_filtro)))
+    df_filtered = get_filtered(clave_filtros, df)
+    
+    # Sin filas no hay nada que graficar: detener el script aquí
+    if df_filtered.empty:
+        st.warning("⚠️ No hay datos con los filtros seleccionados")
+        st.stop()
+    
+    # Predicciones y ABC compartidos entre pestañas; viven en session_state mientras
+    # no cambien los filtros y se reutilizan sin deserializar en los reruns de la sesión
+    if st.session_state.get('_pred_key') != clave_filtros:
+        # Máscara de productos con ventas, compartida por ABC, predicciones y rotación
+        mask_ventas = df_filtered['ventas_mes_actual'].to_numpy() > 0
+        st.session_state['_mask_ventas'] = mask_ventas
+        st.session_state['_con_ventas'] = df_filtered.loc[mask_ventas]
+        st.session_state['_pred'] = predict_demand(df_filtered)
+        st.session_state['_abc'] = construir_abc(st.session_state['_con_ventas'])
+        st.session_state['_pred_key'] = clave_filtros
+    mask_ventas = st.session_state['_mask_ventas']
+    df_con_ventas = st.session_state['_con_ventas']
+    df_pred = st.session_state['_pred']
+    df_abc = st.session_state['_abc']
+    cat_agg = agregados_categoria(clave_filtros, df_pred)
+    
+    # Conteo por estado de stock en una pasada sobre los códigos (pie, alertas y sidebar)
+    estados = df_filtered['estado_stock'].cat
+    codigos = estados.codes.to_numpy()
+    stock_dist = pd.Series(
+        np.bincount(codigos[codigos >= 0], minlength=len(estados.categories)),
+        index=estados.categories
+    )
     
     # Pestañas principales
     tab1, tab2, tab3, tab4, tab5 = st.tabs([
@@ -235,7 +697,7 @@ def main():
     # ================================
     with tab1:
         # KPIs principales
-        kpis = calculate_kpis(df_filtered)
+        kpis = kpis_filtrados(clave_filtros, df_filtered)
         
         col1, col2, col3, col4 = st.columns(4)
         
@@ -275,50 +737,37 @@ def main():
         
         with col1:
             st.subheader("🏆 Top 10 Productos por Ventas")
-            top_ventas = df_filtered.nlargest(10, 'ventas_mes_actual')
+            top_ventas = top_n(df_filtered, 'ventas_mes_actual', 10)
             
-            fig_top = px.bar(
-                top_ventas, 
-                x='ventas_mes_actual', 
-                y='nombre',
+            fig_top = go.Figure(go.Bar(
+                x=top_ventas['ventas_mes_actual'].to_numpy(),
+                y=top_ventas['nombre'].to_numpy(),
                 orientation='h',
-                color='margen_porcentaje',
-                color_continuous_scale='RdYlGn',
-                title="Unidades vendidas este mes"
-            )
-            fig_top.update_layout(height=400, showlegend=False)
+                marker=dict(
+                    color=top_ventas['margen_porcentaje'].to_numpy(),
+                    colorscale=ESCALA_RDYLGN,
+                    showscale=True,
+                    colorbar=dict(title='Margen %')
+                )
+            ))
+            fig_top.update_layout(height=400, showlegend=False, title="Unidades vendidas este mes")
             st.plotly_chart(fig_top, use_container_width=True)
         
         with col2:
             st.subheader("📊 Distribución por Estado de Stock")
-            stock_dist = df_filtered['estado_stock'].value_counts()
-            
-            colors = {
-                '🟢 NORMAL': '#22c55e',
-                '🟡 BAJO': '#eab308', 
-                '🟠 CRÍTICO': '#f97316',
-                '🔴 SIN STOCK': '#ef4444'
-            }
-            
-            fig_pie = px.pie(
-                values=stock_dist.values,
-                names=stock_dist.index,
-                color=stock_dist.index,
-                color_discrete_map=colors,
-                title="Estado actual del inventario"
-            )
-            fig_pie.update_layout(height=400)
+            fig_pie = go.Figure(go.Pie(
+                values=stock_dist.to_numpy(),
+                labels=list(stock_dist.index),
+                marker=dict(colors=COLORES_STOCK),
+                sort=False
+            ))
+            fig_pie.update_layout(height=400, title="Estado actual del inventario")
             st.plotly_chart(fig_pie, use_container_width=True)
         
         # Análisis por categoría
         st.subheader("📂 Análisis por Categoría")
         
-        categoria_analysis = df_filtered.groupby('nombre_categoria').agg({
-            'ventas_mes_actual': 'sum',
-            'utilidad_mes': 'sum',
-            'valor_inventario': 'sum',
-            'producto_id': 'count'
-        }).round(2)
+        categoria_analysis = cat_agg[['ventas', 'utilidad', 'valor', 'productos']].round(2)
         categoria_analysis.columns = ['Ventas (Unidades)', 'Utilidad (Q)', 'Valor Inventario (Q)', 'Productos']
         categoria_analysis = categoria_analysis.sort_values('Utilidad (Q)', ascending=False)
         
@@ -345,25 +794,35 @@ def main():
                     'ventas_mes_actual', 'nombre_proveedor', 'estado_stock'
                 ]].copy()
                 
-                alertas_display['Días de inventario'] = np.where(
-                    alertas_display['ventas_mes_actual'] > 0,
-                    (alertas_display['stock_actual'] / alertas_display['ventas_mes_actual'] * 30).round(1),
-                    'Sin ventas'
-                )
+                # Numérica (NaN = sin ventas); el texto se pone solo al mostrar
+                ventas = alertas_display['ventas_mes_actual'].to_numpy()
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    alertas_display['Días de inventario'] = np.where(
+                        ventas > 0,
+                        alertas_display['stock_actual'].to_numpy() / ventas * 30,
+                        np.nan
+                    ).round(1)
                 
                 alertas_display = alertas_display.sort_values('stock_actual')
                 
-                # Aplicar estilos
-                def highlight_critical(row):
-                    if row['estado_stock'] == '🔴 SIN STOCK':
-                        return ['background-color: #fee2e2'] * len(row)
-                    elif row['estado_stock'] == '🟠 CRÍTICO':
-                        return ['background-color: #fed7aa'] * len(row)
-                    else:
-                        return [''] * len(row)
+                # Aplicar estilos (una sola llamada para toda la tabla)
+                def highlight_critical(data):
+                    estado = data['estado_stock'].to_numpy()
+                    colores = np.select(
+                        [estado == '🔴 SIN STOCK', estado == '🟠 CRÍTICO'],
+                        ['background-color: #fee2e2', 'background-color: #fed7aa'],
+                        default=''
+                    )
+                    return pd.DataFrame(
+                        np.broadcast_to(colores[:, None], data.shape),
+                        index=data.index,
+                        columns=data.columns
+                    )
                 
                 st.dataframe(
-                    alertas_display.style.apply(highlight_critical, axis=1),
+                    alertas_display.style.apply(highlight_critical, axis=None).format(
+                        {'Días de inventario': '{:.1f}'}, na_rep='Sin ventas'
+                    ),
                     use_container_width=True,
                     hide_index=True
                 )
@@ -372,28 +831,24 @@ def main():
                 st.markdown("### 📊 Resumen de Alertas")
                 
                 # Contadores de alertas
-                sin_stock = len(productos_criticos[productos_criticos['estado_stock'] == '🔴 SIN STOCK'])
-                criticos = len(productos_criticos[productos_criticos['estado_stock'] == '🟠 CRÍTICO'])
+                sin_stock = stock_dist['🔴 SIN STOCK']
+                criticos = stock_dist['🟠 CRÍTICO']
+                
+                # Valor inmovilizado
+                valor_critico = productos_criticos['valor_inventario'].sum()
                 
+                # Las tres tarjetas en un solo bloque HTML
                 st.markdown(f"""
                 <div class="metric-container alert-critical">
                     <h3>🔴 Sin Stock</h3>
                     <h2>{sin_stock}</h2>
                     <p>Productos agotados</p>
                 </div>
-                """, unsafe_allow_html=True)
-                
-                st.markdown(f"""
                 <div class="metric-container alert-high">
                     <h3>🟠 Stock Crítico</h3>
                     <h2>{criticos}</h2>
                     <p>Requieren reorden urgente</p>
                 </div>
-                """, unsafe_allow_html=True)
-                
-                # Valor inmovilizado
-                valor_critico = productos_criticos['valor_inventario'].sum()
-                st.markdown(f"""
                 <div class="metric-container alert-medium">
                     <h3>💰 Valor en Riesgo</h3>
                     <h2>Q{valor_critico:,.2f}</h2>
@@ -409,9 +864,15 @@ def main():
         st.subheader("🛒 Recomendaciones de Compra")
         
         if not productos_criticos.empty:
-            compras_recomendadas = productos_criticos.copy()
-            compras_recomendadas['Cantidad Sugerida'] = compras_recomendadas['punto_reorden'] - compras_recomendadas['stock_actual']
-            compras_recomendadas['Inversión Requerida'] = compras_recomendadas['Cantidad Sugerida'] * compras_recomendadas['costo_unitario']
+            # Nunca sugerir cantidades negativas (stock ya por encima del punto de reorden)
+            cantidad = np.maximum(
+                productos_criticos['punto_reorden'].to_numpy() - productos_criticos['stock_actual'].to_numpy(),
+                0
+            )
+            compras_recomendadas = productos_criticos.assign(**{
+                'Cantidad Sugerida': cantidad,
+                'Inversión Requerida': cantidad * productos_criticos['costo_unitario'].to_numpy()
+            })
             
             compras_display = compras_recomendadas[[
                 'nombre', 'nombre_proveedor', 'Cantidad Sugerida', 'costo_unitario', 'Inversión Requerida'
@@ -428,14 +889,11 @@ def main():
     with tab3:
         st.subheader("🔮 Predicciones de Demanda y Stock")
         
-        # Generar predicciones
-        df_pred = predict_demand(df_filtered)
-        
         # Métricas de predicción
         col1, col2, col3 = st.columns(3)
         
         with col1:
-            riesgo_desabasto = len(df_pred[df_pred['riesgo_futuro'] == '⚠️ RIESGO DESABASTO'])
+            riesgo_desabasto = len(df_pred[df_pred['riesgo_futuro'] == RIESGOS_DEMANDA[0]])
             st.metric("⚠️ Riesgo Desabasto", riesgo_desabasto, "productos próximo mes")
         
         with col2:
@@ -449,7 +907,7 @@ def main():
         # Tabla de predicciones
         st.markdown("### 📊 Análisis Predictivo por Producto")
         
-        pred_display = df_pred[df_pred['ventas_mes_actual'] > 0][[
+        pred_display = df_pred.loc[mask_ventas, [
             'nombre', 'ventas_mes_actual', 'ventas_mes_anterior', 'crecimiento_pct',
             'proyeccion_siguiente_mes', 'stock_actual', 'riesgo_futuro', 'compra_sugerida'
         ]].sort_values('crecimiento_pct', ascending=False)
@@ -468,25 +926,37 @@ def main():
         # Gráfico de tendencias
         st.markdown("### 📈 Tendencias de Ventas por Categoría")
         
-        tendencias_cat = df_pred.groupby('nombre_categoria').agg({
-            'ventas_mes_actual': 'sum',
-            'ventas_mes_anterior': 'sum',
-            'crecimiento_pct': 'mean'
+        tendencias_cat = cat_agg[['ventas', 'ventas_ant', 'crecimiento']].rename(columns={
+            'ventas': 'ventas_mes_actual',
+            'ventas_ant': 'ventas_mes_anterior',
+            'crecimiento': 'crecimiento_pct'
         }).reset_index()
         
-        fig_tendencias = px.scatter(
-            tendencias_cat,
-            x='ventas_mes_anterior',
-            y='ventas_mes_actual',
-            size='crecimiento_pct',
-            color='crecimiento_pct',
-            hover_name='nombre_categoria',
-            color_continuous_scale='RdYlGn',
-            title="Evolución de ventas por categoría (tamaño = % crecimiento)"
-        )
-        fig_tendencias.add_line(x=[0, tendencias_cat['ventas_mes_anterior'].max()], 
-                              y=[0, tendencias_cat['ventas_mes_anterior'].max()], 
-                              name="Sin cambio")
+        crecimiento = tendencias_cat['crecimiento_pct'].fillna(0).to_numpy()
+        tamano = np.abs(crecimiento)
+        fig_tendencias = go.Figure(go.Scatter(
+            x=tendencias_cat['ventas_mes_anterior'].to_numpy(),
+            y=tendencias_cat['ventas_mes_actual'].to_numpy(),
+            mode='markers',
+            text=tendencias_cat['nombre_categoria'].astype(str).to_numpy(),
+            hovertemplate='<b>%{text}</b><br>Mes anterior: %{x}<br>Mes actual: %{y}<extra></extra>',
+            name='Categorías',
+            marker=dict(
+                size=tamano,
+                sizemode='area',
+                sizeref=2 * max(tamano.max(), 1) / 40 ** 2,
+                sizemin=4,
+                color=crecimiento,
+                colorscale=ESCALA_RDYLGN,
+                showscale=True,
+                colorbar=dict(title='% crecimiento')
+            )
+        ))
+        limite = tendencias_cat['ventas_mes_anterior'].max()
+        fig_tendencias.add_trace(go.Scatter(
+            x=[0, limite], y=[0, limite], mode='lines', name="Sin cambio"
+        ))
+        fig_tendencias.update_layout(title="Evolución de ventas por categoría (tamaño = % crecimiento)")
         st.plotly_chart(fig_tendencias, use_container_width=True)
     
     # ================================
@@ -499,11 +969,11 @@ def main():
         col1, col2, col3, col4 = st.columns(4)
         
         with col1:
-            ingresos_totales = (df_filtered['ventas_mes_actual'] * df_filtered['precio_venta']).sum()
+            ingresos_totales = df_filtered['ingresos_producto'].sum()
             st.metric("💵 Ingresos Mes", f"Q{ingresos_totales:,.2f}")
         
         with col2:
-            costos_totales = (df_filtered['ventas_mes_actual'] * df_filtered['costo_unitario']).sum()
+            costos_totales = df_filtered['costo_total_mes'].sum()
             st.metric("💸 Costos Mes", f"Q{costos_totales:,.2f}")
         
         with col3:
@@ -517,40 +987,24 @@ def main():
         # Análisis ABC
         st.markdown("### 🎯 Análisis ABC de Productos")
         
-        df_abc = df_filtered[df_filtered['ventas_mes_actual'] > 0].copy()
-        df_abc['ingresos_producto'] = df_abc['ventas_mes_actual'] * df_abc['precio_venta']
-        df_abc = df_abc.sort_values('ingresos_producto', ascending=False)
-        df_abc['ingresos_acumulados'] = df_abc['ingresos_producto'].cumsum()
-        df_abc['porcentaje_acumulado'] = df_abc['ingresos_acumulados'] / df_abc['ingresos_producto'].sum() * 100
-        
-        # Clasificación ABC
-        def clasificar_abc(pct):
-            if pct <= 80:
-                return 'A - Vital (80% ingresos)'
-            elif pct <= 95:
-                return 'B - Importante (15% ingresos)'
-            else:
-                return 'C - Normal (5% ingresos)'
-        
-        df_abc['clasificacion_abc'] = df_abc['porcentaje_acumulado'].apply(clasificar_abc)
-        
         # Mostrar distribución ABC
-        abc_counts = df_abc['clasificacion_abc'].value_counts()
+        abc_counts = df_abc['clasificacion_abc'].value_counts(sort=False)
         
         col1, col2 = st.columns(2)
         
         with col1:
-            fig_abc = px.pie(
-                values=abc_counts.values,
-                names=abc_counts.index,
-                title="Distribución ABC de Productos",
-                color_discrete_sequence=['#ef4444', '#f97316', '#22c55e']
-            )
+            fig_abc = go.Figure(go.Pie(
+                values=abc_counts.to_numpy(),
+                labels=list(abc_counts.index),
+                marker=dict(colors=COLORES_ABC),
+                sort=False
+            ))
+            fig_abc.update_layout(title="Distribución ABC de Productos")
             st.plotly_chart(fig_abc, use_container_width=True)
         
         with col2:
             # Top productos clase A
-            productos_a = df_abc[df_abc['clasificacion_abc'] == 'A - Vital (80% ingresos)'].head(10)
+            productos_a = df_abc[df_abc['clasificacion_abc'] == CLASES_ABC[0]].head(10)
             st.markdown("**🏆 Top 10 Productos Clase A**")
             
             productos_display = productos_a[['nombre', 'ingresos_producto', 'margen_porcentaje']].copy()
@@ -560,16 +1014,7 @@ def main():
         # Análisis de rentabilidad por proveedor
         st.markdown("### 🏢 Performance por Proveedor")
         
-        proveedor_analysis = df_filtered.groupby('nombre_proveedor').agg({
-            'ventas_mes_actual': 'sum',
-            'utilidad_mes': 'sum',
-            'valor_inventario': 'sum',
-            'margen_porcentaje': 'mean',
-            'producto_id': 'count'
-        }).round(2)
-        
-        proveedor_analysis.columns = ['Ventas (Un.)', 'Utilidad (Q)', 'Valor Inv. (Q)', 'Margen %', 'Productos']
-        proveedor_analysis = proveedor_analysis.sort_values('Utilidad (Q)', ascending=False)
+        proveedor_analysis = analisis_proveedor(clave_filtros, df_filtered)
         
         st.dataframe(proveedor_analysis, use_container_width=True)
     
@@ -577,164 +1022,7 @@ def main():
     # TAB 5: REPORTES DETALLADOS
     # ================================
     with tab5:
-        st.subheader("📋 Reportes Detallados del Inventario")
-        
-        # Selector de tipo de reporte
-        tipo_reporte = st.selectbox(
-            "📊 Seleccionar Tipo de Reporte",
-            [
-                "Inventario Completo",
-                "Productos Más Vendidos",
-                "Análisis de Rotación",
-                "Productos Sin Movimiento",
-                "Reporte de Márgenes"
-            ]
-        )
-        
-        if tipo_reporte == "Inventario Completo":
-            st.markdown("### 📦 Inventario Completo")
-            
-            inventario_completo = df_filtered[[
-                'nombre', 'nombre_categoria', 'stock_actual', 'stock_minimo', 
-                'precio_venta', 'costo_unitario', 'margen_porcentaje',
-                'ventas_mes_actual', 'valor_inventario', 'estado_stock',
-                'nombre_proveedor'
-            ]].sort_values('valor_inventario', ascending=False)
-            
-            st.dataframe(inventario_completo, use_container_width=True, hide_index=True)
-        
-        elif tipo_reporte == "Productos Más Vendidos":
-            st.markdown("### 🏆 Top Productos por Ventas")
-            
-            top_products = df_filtered.nlargest(20, 'ventas_mes_actual')[[
-                'nombre', 'ventas_mes_actual', 'ventas_mes_anterior',
-                'utilidad_mes', 'stock_actual', 'rotacion_mensual'
-            ]]
-            
-            st.dataframe(top_products, use_container_width=True, hide_index=True)
-        
-        elif tipo_reporte == "Análisis de Rotación":
-            st.markdown("### 🔄 Análisis de Rotación de Inventario")
-            
-            rotacion_analysis = df_filtered[df_filtered['ventas_mes_actual'] > 0].copy()
-            rotacion_analysis['meses_inventario'] = np.where(
-                rotacion_analysis['ventas_mes_actual'] > 0,
-                rotacion_analysis['stock_actual'] / rotacion_analysis['ventas_mes_actual'],
-                999
-            )
-            
-            # Clasificar rotación
-            def clasificar_rotacion(meses):
-                if meses < 1:
-                    return '🟢 Excelente (<1 mes)'
-                elif meses < 2:
-                    return '🟡 Buena (1-2 meses)'
-                elif meses < 3:
-                    return '🟠 Regular (2-3 meses)'
-                else:
-                    return '🔴 Lenta (>3 meses)'
-            
-            rotacion_analysis['clasificacion_rotacion'] = rotacion_analysis['meses_inventario'].apply(clasificar_rotacion)
-            
-            rotacion_display = rotacion_analysis[[
-                'nombre', 'ventas_mes_actual', 'stock_actual', 'meses_inventario',
-                'clasificacion_rotacion', 'valor_inventario'
-            ]].sort_values('meses_inventario', ascending=False)
-            
-            st.dataframe(rotacion_display, use_container_width=True, hide_index=True)
-        
-        elif tipo_reporte == "Productos Sin Movimiento":
-            st.markdown("### 📉 Productos con Poco o Sin Movimiento")
-            
-            sin_movimiento = df_filtered[
-                (df_filtered['ventas_mes_actual'] <= 2) | 
-                (df_filtered['ventas_mes_actual'] == 0)
-            ].copy()
-            
-            sin_movimiento['valor_inmovilizado'] = sin_movimiento['stock_actual'] * sin_movimiento['costo_unitario']
-            
-            if not sin_movimiento.empty:
-                sin_mov_display = sin_movimiento[[
-                    'nombre', 'nombre_categoria', 'stock_actual', 'ventas_mes_actual',
-                    'ventas_trimestre', 'valor_inmovilizado', 'fecha_ultima_venta'
-                ]].sort_values('valor_inmovilizado', ascending=False)
-                
-                st.dataframe(sin_mov_display, use_container_width=True, hide_index=True)
-                
-                total_inmovilizado = sin_movimiento['valor_inmovilizado'].sum()
-                st.warning(f"💰 **Capital inmovilizado total:** Q{total_inmovilizado:,.2f}")
-            else:
-                st.success("🎉 ¡Todos los productos tienen movimiento activo!")
-        
-        elif tipo_reporte == "Reporte de Márgenes":
-            st.markdown("### 💹 Análisis de Márgenes de Utilidad")
-            
-            margenes_analysis = df_filtered.copy()
-            margenes_analysis = margenes_analysis.sort_values('margen_porcentaje', ascending=False)
-            
-            margenes_display = margenes_analysis[[
-                'nombre', 'costo_unitario', 'precio_venta', 'utilidad_unitaria',
-                'margen_porcentaje', 'ventas_mes_actual', 'utilidad_mes'
-            ]]
-            
-            st.dataframe(margenes_display, use_container_width=True, hide_index=True)
-            
-            # Estadísticas de márgenes
-            col1, col2, col3 = st.columns(3)
-            
-            with col1:
-                margen_promedio = margenes_analysis['margen_porcentaje'].mean()
-                st.metric("📊 Margen Promedio", f"{margen_promedio:.1f}%")
-            
-            with col2:
-                margen_maximo = margenes_analysis['margen_porcentaje'].max()
-                st.metric("📈 Margen Máximo", f"{margen_maximo:.1f}%")
-            
-            with col3:
-                margen_minimo = margenes_analysis['margen_porcentaje'].min()
-                st.metric("📉 Margen Mínimo", f"{margen_minimo:.1f}%")
-        
-        # Botones de descarga
-        st.markdown("---")
-        st.markdown("### 📥 Descargar Reportes")
-        
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            # Preparar datos para descarga
-            if st.button("📊 Descargar Inventario Completo"):
-                csv_data = df_filtered.to_csv(index=False)
-                st.download_button(
-                    label="💾 Descargar CSV",
-                    data=csv_data,
-                    file_name=f"inventario_completo_{datetime.now().strftime('%Y%m%d')}.csv",
-                    mime="text/csv"
-                )
-        
-        with col2:
-            if st.button("⚠️ Descargar Productos Críticos"):
-                productos_criticos_download = df_filtered[df_filtered['estado_stock'].isin(['🔴 SIN STOCK', '🟠 CRÍTICO'])]
-                if not productos_criticos_download.empty:
-                    csv_criticos = productos_criticos_download.to_csv(index=False)
-                    st.download_button(
-                        label="💾 Descargar CSV",
-                        data=csv_criticos,
-                        file_name=f"productos_criticos_{datetime.now().strftime('%Y%m%d')}.csv",
-                        mime="text/csv"
-                    )
-                else:
-                    st.info("No hay productos críticos para descargar")
-        
-        with col3:
-            if st.button("📈 Descargar Análisis ABC"):
-                if 'df_abc' in locals():
-                    csv_abc = df_abc.to_csv(index=False)
-                    st.download_button(
-                        label="💾 Descargar CSV",
-                        data=csv_abc,
-                        file_name=f"analisis_abc_{datetime.now().strftime('%Y%m%d')}.csv",
-                        mime="text/csv"
-                    )
+        render_reportes(df_filtered, df_con_ventas, df_abc, clave_filtros)
     
     # ================================
     # SIDEBAR: INFORMACIÓN ADICIONAL
@@ -750,10 +1038,10 @@ def main():
     st.sidebar.metric("📦 Productos Filtrados", productos_activos)
     
     # Distribución por estado
-    estado_counts = df_filtered['estado_stock'].value_counts()
-    st.sidebar.markdown("**📊 Estado del Stock:**")
-    for estado, count in estado_counts.items():
-        st.sidebar.write(f"{estado}: {count}")
+    st.sidebar.markdown(
+        "**📊 Estado del Stock:**\n" +
+        "\n".join(f"- {estado}: {count}" for estado, count in stock_dist.items())
+    )
     
     st.sidebar.markdown("---")
     st.sidebar.markdown("### ℹ️ Información del Sistema")
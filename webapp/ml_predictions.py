@@ -12,78 +12,162 @@ Funcionalidades:
 - Clustering de productos
 """
 
+import os
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import warnings
 warnings.filterwarnings('ignore')
 
-# ML Libraries
-from sklearn.ensemble import RandomForestRegressor, IsolationForest
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
-from sklearn.metrics import mean_absolute_error, mean_squared_error
-from sklearn.model_selection import train_test_split
+# ML Libraries: sklearn (y joblib) se importan dentro de cada método, así la
+# webapp no paga su carga (~1 s, arrastra scipy) hasta usar el análisis ML
+
+# Núcleos físicos para n_jobs (opcional; sin psutil se usan los lógicos)
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+# Kernel compilado para las características por fila (opcional)
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# Por debajo de estas filas el arranque de procesos de joblib cuesta más que el entrenamiento
+MIN_FILAS_PARALELO = 2000
+
+# Desde estas filas la demanda se entrena con boosting sobre histogramas en lugar de Random Forest
+MIN_FILAS_HISTOGRAMA = 10000
+
+# Características del modelo de demanda
+COLUMNAS_DEMANDA = [
+    'ventas_mes_actual', 'ventas_mes_anterior', 'ventas_trimestre',
+    'stock_actual', 'precio_ratio', 'margen_absoluto', 'rotacion_anual',
+    'tendencia_ventas', 'ratio_stock_ventas', 'categoria_encoded',
+    'proveedor_encoded', 'dias_desde_ultima_venta', 'estacionalidad'
+]
+
+# Desde estas filas el clustering usa mini-lotes en lugar de K-Means exacto
+MIN_FILAS_MINIBATCH = 5000
+
+# Niveles de riesgo de desabasto, de mayor a menor (el código es el índice)
+NIVELES_RIESGO = ['ALTO', 'MEDIO', 'BAJO']
+
+# Quintiles del score de anomalía, del más anómalo al más típico
+PERCENTILES_ANOMALIA = ['Muy Anómalo', 'Anómalo', 'Normal', 'Típico', 'Muy Típico']
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, cache=True, error_model='numpy')
+    def caracteristicas_inventario(precio, costo, stock, ventas, ventas_ant,
+                                   precio_ratio, margen, rotacion, tendencia, ratio_stock):
+        """Características derivadas de inventario en una sola pasada por fila"""
+        for i in prange(precio.shape[0]):
+            precio_ratio[i] = precio[i] / costo[i]
+            margen[i] = precio[i] - costo[i]
+            rotacion[i] = 12 * ventas[i] / stock[i] if stock[i] > 0 else 0
+            tendencia[i] = (ventas[i] - ventas_ant[i]) / ventas_ant[i] if ventas_ant[i] > 0 else 0
+            ratio_stock[i] = stock[i] / ventas[i] if ventas[i] > 0 else 999
 
 class InventoryMLAnalyzer:
     """
     Clase principal para análisis de Machine Learning del inventario
     """
     
-    def __init__(self, data):
+    def __init__(self, data, ajustes=None):
         """
         Inicializar el analizador ML
         
         Args:
-            data (pd.DataFrame): DataFrame con datos del inventario
+            data (pd.DataFrame): DataFrame con datos del inventario; se guarda
+                por referencia (sin copia): el analizador nunca lo modifica y
+                quien lo llama tampoco debe modificarlo mientras lo use
+            ajustes (dict): Columnas que reemplazan a las de data al preparar
+                características (escenarios)
         """
-        self.data = data.copy()
-        self.scaler = StandardScaler()
+        self.ajustes = ajustes or {}
+        self.data = data
+        self._rng = np.random.default_rng(42)  # generador propio (PCG64) para las características simuladas
         self.demand_model = None
         self.anomaly_model = None
         self.cluster_model = None
+        self._datos_demanda = None
+        self.n_jobs = None  # None: según tamaño y núcleos físicos (ver trabajos_paralelos)
+        
+    @property
+    def data(self):
+        """DataFrame de inventario analizado"""
+        return self._data
+    
+    @data.setter
+    def data(self, value):
+        # Al cambiar los datos se invalidan las características calculadas
+        self._data = value
+        self._features_cache = None
         
     def prepare_features(self):
         """
-        Preparar características para modelos ML
+        Preparar características para modelos ML (se calculan una vez por
+        conjunto de datos y se reutilizan en demanda, anomalías y clusters)
         
         Returns:
             pd.DataFrame: DataFrame con características preparadas
         """
-        df = self.data.copy()
-        
-        # Calcular características adicionales
-        df['precio_ratio'] = df['precio_venta'] / df['costo_unitario']
-        df['margen_absoluto'] = df['precio_venta'] - df['costo_unitario']
-        df['rotacion_anual'] = np.where(
-            df['stock_actual'] > 0,
-            12 * df['ventas_mes_actual'] / df['stock_actual'],
-            0
-        )
-        
-        # Tendencia de ventas
-        df['tendencia_ventas'] = np.where(
-            df['ventas_mes_anterior'] > 0,
-            (df['ventas_mes_actual'] - df['ventas_mes_anterior']) / df['ventas_mes_anterior'],
-            0
-        )
-        
-        # Ratio stock/ventas
-        df['ratio_stock_ventas'] = np.where(
-            df['ventas_mes_actual'] > 0,
-            df['stock_actual'] / df['ventas_mes_actual'],
-            999  # Valor alto para productos sin ventas
+        if self._features_cache is not None:
+            return self._features_cache
+        
+        df = self.data.assign(**self.ajustes) if self.ajustes else self.data
+        n = len(df)
+        
+        # Columnas fuente leídas una sola vez, en float32
+        precio = df['precio_venta'].to_numpy(dtype=np.float32)
+        costo = df['costo_unitario'].to_numpy(dtype=np.float32)
+        stock = df['stock_actual'].to_numpy(dtype=np.float32)
+        ventas = df['ventas_mes_actual'].to_numpy(dtype=np.float32)
+        ventas_ant = df['ventas_mes_anterior'].to_numpy(dtype=np.float32)
+        
+        if NUMBA_AVAILABLE:
+            precio_ratio, margen_absoluto, rotacion_anual, tendencia_ventas, ratio_stock_ventas = (
+                np.empty(n, dtype=np.float32) for _ in range(5)
+            )
+            caracteristicas_inventario(
+                precio, costo, stock, ventas, ventas_ant,
+                precio_ratio, margen_absoluto, rotacion_anual, tendencia_ventas, ratio_stock_ventas
+            )
+        else:
+            precio_ratio = precio / costo
+            margen_absoluto = precio - costo
+            
+            # Divisiones protegidas: solo se divide donde el denominador es positivo
+            rotacion_anual = np.zeros(n, dtype=np.float32)
+            np.divide(12 * ventas, stock, out=rotacion_anual, where=stock > 0)
+            
+            tendencia_ventas = np.zeros(n, dtype=np.float32)
+            np.divide(ventas - ventas_ant, ventas_ant, out=tendencia_ventas, where=ventas_ant > 0)
+            
+            ratio_stock_ventas = np.full(n, 999, dtype=np.float32)  # Valor alto para productos sin ventas
+            np.divide(stock, ventas, out=ratio_stock_ventas, where=ventas > 0)
+        
+        # assign solo agrega columnas nuevas; las originales no se duplican
+        self._features_cache = df.assign(
+            precio_ratio=precio_ratio,
+            margen_absoluto=margen_absoluto,
+            rotacion_anual=rotacion_anual,
+            tendencia_ventas=tendencia_ventas,
+            ratio_stock_ventas=ratio_stock_ventas,
+            
+            # Variables categóricas numéricas (códigos por orden de aparición)
+            categoria_encoded=pd.factorize(df['categoria_id'].to_numpy(), sort=False)[0].astype(np.int32),
+            proveedor_encoded=pd.factorize(df['proveedor_id'].to_numpy(), sort=False)[0].astype(np.int32),
+            
+            # Características temporales (simuladas)
+            dias_desde_ultima_venta=self._rng.integers(1, 90, n, dtype=np.int32),
+            estacionalidad=np.float32(np.sin(2 * np.pi * pd.to_datetime('today').month / 12))
         )
         
-        # Variables categóricas numéricas
-        df['categoria_encoded'] = pd.Categorical(df['categoria_id']).codes
-        df['proveedor_encoded'] = pd.Categorical(df['proveedor_id']).codes
-        
-        # Características temporales (simuladas)
-        df['dias_desde_ultima_venta'] = np.random.randint(1, 90, len(df))
-        df['estacionalidad'] = np.sin(2 * np.pi * pd.to_datetime('today').month / 12)
-        
-        return df
+        return self._features_cache
     
     def predict_demand(self, horizon_days=30):
         """
@@ -95,83 +179,117 @@ class InventoryMLAnalyzer:
         Returns:
             pd.DataFrame: Predicciones de demanda
         """
-        df = self.prepare_features()
+        from sklearn.ensemble import RandomForestRegressor, HistGradientBoostingRegressor
+        from sklearn.metrics import mean_absolute_error, mean_squared_error
+        from sklearn.model_selection import train_test_split
         
-        # Seleccionar características para el modelo
-        feature_cols = [
-            'ventas_mes_actual', 'ventas_mes_anterior', 'ventas_trimestre',
-            'stock_actual', 'precio_ratio', 'margen_absoluto', 'rotacion_anual',
-            'tendencia_ventas', 'ratio_stock_ventas', 'categoria_encoded',
-            'proveedor_encoded', 'dias_desde_ultima_venta', 'estacionalidad'
-        ]
+        df = self.prepare_features()
         
         # Filtrar productos con suficiente historial
-        df_model = df[df['ventas_trimestre'] > 0].copy()
+        df_model = df[df['ventas_trimestre'] > 0]
         
         if len(df_model) < 10:
             # Si no hay suficientes datos, usar predicción simple
             return self._simple_demand_prediction(df, horizon_days)
         
-        X = df_model[feature_cols].fillna(0)
+        X = df_model[COLUMNAS_DEMANDA].fillna(0)
         y = df_model['ventas_mes_actual']
+        self._datos_demanda = None
         
         # Entrenar modelo
-        self.demand_model = RandomForestRegressor(
-            n_estimators=100,
-            max_depth=10,
-            random_state=42,
-            n_jobs=-1
-        )
-        
-        # Dividir datos para validación
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y, test_size=0.2, random_state=42
-        )
-        
-        self.demand_model.fit(X_train, y_train)
-        
-        # Hacer predicciones
-        y_pred_test = self.demand_model.predict(X_test)
-        mae = mean_absolute_error(y_test, y_pred_test)
-        rmse = np.sqrt(mean_squared_error(y_test, y_pred_test))
+        n_filas = len(df_model)
+        if n_filas < MIN_FILAS_HISTOGRAMA:
+            # Tamaño del bosque acorde al inventario: pocos productos no
+            # necesitan 100 árboles de profundidad 10
+            self.demand_model = RandomForestRegressor(
+                n_estimators=min(100, max(32, n_filas // 50)),
+                max_depth=min(10, int(np.log2(n_filas)) + 1),
+                bootstrap=True,
+                oob_score=True,
+                random_state=42,
+                n_jobs=self.n_jobs or trabajos_paralelos(n_filas)
+            )
+            
+            # Validación fuera de bolsa: cada árbol deja fuera ~37% de las filas,
+            # así que se entrena con todos los datos y sin partición aparte
+            # (con 32 árboles o más casi toda fila queda fuera de alguno)
+            self.demand_model.fit(X, y)
+            predictions = self.demand_model.predict(X)
+            y_ref = y
+            y_val = y.to_numpy()
+            y_pred_val = self.demand_model.oob_prediction_
+            
+            # Filas que ningún árbol dejó fuera no tienen predicción OOB
+            # (sklearn las deja en 0): se excluyen de las métricas
+            con_oob = np.zeros(n_filas, dtype=bool)
+            for muestras in self.demand_model.estimators_samples_:
+                fuera = np.ones(n_filas, dtype=bool)
+                fuera[muestras] = False
+                con_oob |= fuera
+            y_val, y_pred_val = y_val[con_oob], y_pred_val[con_oob]
+        else:
+            # Inventarios grandes: las características se discretizan una vez
+            # en histogramas y los árboles crecen sobre los bins
+            self.demand_model = HistGradientBoostingRegressor(
+                max_iter=100,
+                max_depth=8,
+                learning_rate=0.1,
+                early_stopping=True,
+                random_state=42
+            )
+            
+            # Dividir datos para validación (por posición, para reutilizar la predicción completa)
+            train_idx, test_idx = train_test_split(
+                np.arange(n_filas), test_size=0.2, random_state=42
+            )
+            y_ref = y.iloc[train_idx]
+            self.demand_model.fit(X.iloc[train_idx], y_ref)
+            
+            # Predecir una sola vez para todo el dataset; la validación toma su parte
+            predictions = self.demand_model.predict(X)
+            y_val, y_pred_val = y.iloc[test_idx], predictions[test_idx]
+            
+            # Filas de validación (no vistas en el ajuste) para la importancia por permutación
+            self._datos_demanda = (X.iloc[test_idx], y_val)
         
-        # Predecir para todo el dataset
-        predictions = self.demand_model.predict(X)
+        mae = mean_absolute_error(y_val, y_pred_val)
+        rmse = np.sqrt(mean_squared_error(y_val, y_pred_val))
         
         # Ajustar predicciones por horizon_days
         factor_tiempo = horizon_days / 30  # Normalizar a mes
         predictions_adjusted = predictions * factor_tiempo
         
-        # Crear DataFrame de resultados
-        results = df_model[['producto_id', 'nombre', 'ventas_mes_actual', 'stock_actual']].copy()
-        results['prediccion_demanda'] = np.maximum(0, predictions_adjusted.round(0).astype(int))
-        results['confianza_prediccion'] = np.minimum(100, 100 - (mae / y_train.mean() * 100))
-        
-        # Calcular métricas de riesgo
-        results['riesgo_desabasto'] = np.where(
-            results['stock_actual'] < results['prediccion_demanda'],
-            'ALTO',
-            np.where(
-                results['stock_actual'] < results['prediccion_demanda'] * 1.5,
-                'MEDIO',
-                'BAJO'
-            )
-        )
-        
-        results['cantidad_sugerida_compra'] = np.maximum(
-            0, 
-            results['prediccion_demanda'] * 1.2 - results['stock_actual']  # 20% buffer
-        ).round(0).astype(int)
+        # Columnas de resultados como arrays
+        stock = df_model['stock_actual'].to_numpy()
+        demanda = np.maximum(0, predictions_adjusted.round(0).astype(int))
+        confianza = min(100, 100 - (mae / y_ref.mean() * 100))
+        
+        # Calcular métricas de riesgo (código entero; la etiqueta es un Categorical)
+        codigos_riesgo = np.select([stock < demanda, stock < demanda * 1.5], [0, 1], default=2).astype(np.int8)
+        compra = np.maximum(0, demanda * 1.2 - stock).round(0).astype(int)  # 20% buffer
+        
+        # Crear DataFrame de resultados de una vez, ya ordenado por riesgo
+        orden = np.argsort(codigos_riesgo, kind='stable')
+        results = pd.DataFrame({
+            'producto_id': df_model['producto_id'].to_numpy()[orden],
+            'nombre': df_model['nombre'].to_numpy()[orden],
+            'ventas_mes_actual': df_model['ventas_mes_actual'].to_numpy()[orden],
+            'stock_actual': stock[orden],
+            'prediccion_demanda': demanda[orden],
+            'confianza_prediccion': np.full(len(orden), confianza),
+            'riesgo_desabasto': pd.Categorical.from_codes(codigos_riesgo[orden], categories=NIVELES_RIESGO),
+            'cantidad_sugerida_compra': compra[orden]
+        }, index=df_model.index[orden])
         
         # Métricas del modelo
         model_metrics = {
             'mae': mae,
             'rmse': rmse,
             'productos_analizados': len(df_model),
-            'precision_promedio': results['confianza_prediccion'].mean()
+            'precision_promedio': confianza
         }
         
-        return results.sort_values('riesgo_desabasto', key=lambda x: x.map({'ALTO': 1, 'MEDIO': 2, 'BAJO': 3})), model_metrics
+        return results, model_metrics
     
     def _simple_demand_prediction(self, df, horizon_days):
         """
@@ -188,7 +306,9 @@ class InventoryMLAnalyzer:
         ).astype(int)
         
         results['confianza_prediccion'] = 50  # Confianza baja
-        results['riesgo_desabasto'] = 'MEDIO'  # Asumir riesgo medio
+        results['riesgo_desabasto'] = pd.Categorical.from_codes(  # Asumir riesgo medio
+            np.ones(len(results), dtype=np.int8), categories=NIVELES_RIESGO
+        )
         results['cantidad_sugerida_compra'] = np.maximum(
             0, results['prediccion_demanda'] - results['stock_actual']
         ).astype(int)
@@ -209,6 +329,8 @@ class InventoryMLAnalyzer:
         Returns:
             pd.DataFrame: Productos con anomalías detectadas
         """
+        from sklearn.ensemble import IsolationForest
+        
         df = self.prepare_features()
         
         # Seleccionar características para detección de anomalías
@@ -217,45 +339,48 @@ class InventoryMLAnalyzer:
             'rotacion_anual', 'tendencia_ventas', 'ratio_stock_ventas'
         ]
         
-        df_anomaly = df[anomaly_features].fillna(0)
-        
         # Normalizar datos
-        df_scaled = self.scaler.fit_transform(df_anomaly)
+        df_scaled = estandarizar(df, anomaly_features)
         
         # Entrenar modelo de detección de anomalías
         self.anomaly_model = IsolationForest(
             contamination=0.1,  # 10% de datos como anomalías
             random_state=42,
-            n_jobs=-1
+            n_jobs=self.n_jobs or trabajos_paralelos(len(df))
         )
         
-        anomaly_labels = self.anomaly_model.fit_predict(df_scaled)
+        # Un solo recorrido de los árboles: las etiquetas salen del score
+        # con el mismo umbral (offset_) que usaría predict
+        self.anomaly_model.fit(df_scaled)
         anomaly_scores = self.anomaly_model.score_samples(df_scaled)
+        anomaly_labels = np.where(anomaly_scores < self.anomaly_model.offset_, -1, 1)
         
         # Preparar resultados
         results = df[['producto_id', 'nombre', 'ventas_mes_actual', 'stock_actual']].copy()
         results['es_anomalia'] = anomaly_labels == -1
         results['score_anomalia'] = anomaly_scores
-        results['percentil_anomalia'] = pd.qcut(
-            anomaly_scores, 
-            q=5, 
-            labels=['Muy Anómalo', 'Anómalo', 'Normal', 'Típico', 'Muy Típico']
+        # Quintiles del score: bordes interiores y búsqueda binaria (mismos intervalos que qcut)
+        bordes = np.quantile(anomaly_scores, [0.2, 0.4, 0.6, 0.8])
+        results['percentil_anomalia'] = pd.Categorical.from_codes(
+            np.searchsorted(bordes, anomaly_scores).astype(np.int8),
+            categories=PERCENTILES_ANOMALIA
         )
         
-        # Clasificar tipo de anomalía
-        def clasificar_anomalia(row):
-            if not row['es_anomalia']:
-                return 'Normal'
-            elif row['ventas_mes_actual'] > row['ventas_mes_anterior'] * 3:
-                return 'Pico de Ventas'
-            elif row['ventas_mes_actual'] < row['ventas_mes_anterior'] * 0.3 and row['ventas_mes_anterior'] > 0:
-                return 'Caída Drástica'
-            elif row['stock_actual'] > row['ventas_mes_actual'] * 6:
-                return 'Sobrestock'
-            else:
-                return 'Patrón Irregular'
-        
-        results['tipo_anomalia'] = df.apply(clasificar_anomalia, axis=1)
+        # Clasificar tipo de anomalía (vectorizado, primera condición que se cumple)
+        ventas = df['ventas_mes_actual'].to_numpy()
+        ventas_ant = df['ventas_mes_anterior'].to_numpy()
+        stock = df['stock_actual'].to_numpy()
+        es_anomalia = results['es_anomalia'].to_numpy()
+        results['tipo_anomalia'] = np.select(
+            [
+                ~es_anomalia,
+                ventas > ventas_ant * 3,
+                (ventas < ventas_ant * 0.3) & (ventas_ant > 0),
+                stock > ventas * 6
+            ],
+            ['Normal', 'Pico de Ventas', 'Caída Drástica', 'Sobrestock'],
+            default='Patrón Irregular'
+        )
         
         # Filtrar solo anomalías
         anomalies = results[results['es_anomalia']].sort_values('score_anomalia')
@@ -272,6 +397,8 @@ class InventoryMLAnalyzer:
         Returns:
             pd.DataFrame: Productos con clusters asignados
         """
+        from sklearn.cluster import KMeans, MiniBatchKMeans
+        
         df = self.prepare_features()
         
         # Características para clustering
@@ -280,17 +407,23 @@ class InventoryMLAnalyzer:
             'precio_ratio', 'tendencia_ventas', 'ratio_stock_ventas'
         ]
         
-        df_cluster = df[cluster_features].fillna(0)
-        
         # Normalizar datos
-        df_scaled = self.scaler.fit_transform(df_cluster)
-        
-        # Aplicar K-Means
-        self.cluster_model = KMeans(
-            n_clusters=n_clusters,
-            random_state=42,
-            n_init=10
-        )
+        df_scaled = estandarizar(df, cluster_features)
+        
+        # Aplicar K-Means (mini-lotes en inventarios grandes)
+        if len(df_scaled) < MIN_FILAS_MINIBATCH:
+            self.cluster_model = KMeans(
+                n_clusters=n_clusters,
+                random_state=42,
+                n_init=10
+            )
+        else:
+            self.cluster_model = MiniBatchKMeans(
+                n_clusters=n_clusters,
+                batch_size=1024,
+                random_state=42,
+                n_init=3
+            )
         
         cluster_labels = self.cluster_model.fit_predict(df_scaled)
         
@@ -306,21 +439,31 @@ class InventoryMLAnalyzer:
             'precio_venta': 'mean'
         }).round(2)
         
-        # Asignar nombres descriptivos a clusters
-        cluster_names = {}
-        for i in range(n_clusters):
-            stats = cluster_stats.iloc[i]
-            if stats['ventas_mes_actual'] > df['ventas_mes_actual'].quantile(0.8):
-                if stats['margen_porcentaje'] > df['margen_porcentaje'].quantile(0.7):
-                    cluster_names[i] = 'Estrellas (Alta Venta, Alto Margen)'
-                else:
-                    cluster_names[i] = 'Volumen (Alta Venta, Bajo Margen)'
-            elif stats['margen_porcentaje'] > df['margen_porcentaje'].quantile(0.8):
-                cluster_names[i] = 'Premium (Baja Venta, Alto Margen)'
-            elif stats['rotacion_anual'] < df['rotacion_anual'].quantile(0.3):
-                cluster_names[i] = 'Lento Movimiento'
-            else:
-                cluster_names[i] = 'Estándar'
+        # Asignar nombres descriptivos a clusters (umbrales calculados una sola vez;
+        # np.quantile selecciona por partición, sin ordenar la columna completa)
+        q_ventas_80 = np.quantile(df['ventas_mes_actual'].to_numpy(), 0.8)
+        q_margen_70, q_margen_80 = np.nanquantile(df['margen_porcentaje'].to_numpy(dtype=np.float64), [0.7, 0.8])
+        q_rotacion_30 = np.quantile(df['rotacion_anual'].to_numpy(), 0.3)
+        
+        ventas = cluster_stats['ventas_mes_actual'].to_numpy()
+        margen = cluster_stats['margen_porcentaje'].to_numpy()
+        rotacion = cluster_stats['rotacion_anual'].to_numpy()
+        nombres = np.select(
+            [
+                (ventas > q_ventas_80) & (margen > q_margen_70),
+                ventas > q_ventas_80,
+                margen > q_margen_80,
+                rotacion < q_rotacion_30
+            ],
+            [
+                'Estrellas (Alta Venta, Alto Margen)',
+                'Volumen (Alta Venta, Bajo Margen)',
+                'Premium (Baja Venta, Alto Margen)',
+                'Lento Movimiento'
+            ],
+            default='Estándar'
+        )
+        cluster_names = dict(zip(cluster_stats.index.tolist(), nombres.tolist()))
         
         results['nombre_cluster'] = results['cluster'].map(cluster_names)
         
@@ -368,14 +511,16 @@ class InventoryMLAnalyzer:
         """
         Generar acciones críticas basadas en predicciones
         """
-        critical = demand_pred[demand_pred['riesgo_desabasto'] == 'ALTO'].copy()
+        mask = demand_pred['riesgo_desabasto'].to_numpy() == 'ALTO'
         
-        if critical.empty:
+        if not mask.any():
             return pd.DataFrame()
         
-        critical['accion_recomendada'] = 'Compra Urgente'
-        critical['prioridad'] = 'ALTA'
-        critical['tiempo_limite'] = '7 días'
+        critical = demand_pred.iloc[mask.nonzero()[0]].assign(
+            accion_recomendada='Compra Urgente',
+            prioridad='ALTA',
+            tiempo_limite='7 días'
+        )
         
         return critical[['nombre', 'stock_actual', 'prediccion_demanda', 
                         'cantidad_sugerida_compra', 'accion_recomendada', 'prioridad']]
@@ -420,9 +565,49 @@ class InventoryMLAnalyzer:
 # FUNCIONES AUXILIARES
 # ================================
 
+def estandarizar(df, columnas):
+    """
+    Estandarizar columnas (media 0, desviación 1) en una matriz float32,
+    operando en sitio sobre la única copia que se crea
+    
+    Args:
+        df (pd.DataFrame): DataFrame con las características
+        columnas (list): Columnas a estandarizar
+        
+    Returns:
+        np.ndarray: Matriz estandarizada (filas x columnas)
+    """
+    X = df[columnas].to_numpy(dtype=np.float32, copy=True)
+    np.nan_to_num(X, copy=False)
+    
+    media = X.mean(axis=0)
+    desviacion = X.std(axis=0)
+    desviacion[desviacion == 0] = 1  # columnas constantes quedan en 0
+    X -= media
+    X /= desviacion
+    return X
+
+def trabajos_paralelos(n_filas):
+    """
+    Número de procesos para los modelos de sklearn: uno solo en tablas
+    pequeñas y un proceso por núcleo físico (sin SMT) en las grandes
+    
+    Args:
+        n_filas (int): Filas de entrenamiento
+        
+    Returns:
+        int: Valor para n_jobs
+    """
+    if n_filas < MIN_FILAS_PARALELO:
+        return 1
+    if PSUTIL_AVAILABLE:
+        return psutil.cpu_count(logical=False) or 1
+    return os.cpu_count() or 1
+
 def get_feature_importance(analyzer):
     """
-    Obtener importancia de características del modelo de demanda
+    Obtener importancia de características del modelo de demanda,
+    normalizada para sumar 1 con cualquiera de los dos modelos
     
     Args:
         analyzer (InventoryMLAnalyzer): Analizador entrenado
@@ -430,26 +615,60 @@ def get_feature_importance(analyzer):
     Returns:
         pd.DataFrame: Importancia de características
     """
+    from sklearn.inspection import permutation_importance
+    
     if analyzer.demand_model is None:
         return pd.DataFrame()
     
-    feature_names = [
-        'ventas_mes_actual', 'ventas_mes_anterior', 'ventas_trimestre',
-        'stock_actual', 'precio_ratio', 'margen_absoluto', 'rotacion_anual',
-        'tendencia_ventas', 'ratio_stock_ventas', 'categoria_encoded',
-        'proveedor_encoded', 'dias_desde_ultima_venta', 'estacionalidad'
-    ]
+    if hasattr(analyzer.demand_model, 'feature_importances_'):
+        importancias = analyzer.demand_model.feature_importances_
+    else:
+        # Boosting por histogramas no expone importancias: se miden por permutación
+        # sobre las filas de validación y se llevan a la escala del bosque
+        X, y = analyzer._datos_demanda
+        importancias = np.clip(permutation_importance(
+            analyzer.demand_model, X, y, n_repeats=5, random_state=42
+        ).importances_mean, 0, None)
+        total = importancias.sum()
+        if total > 0:
+            importancias = importancias / total
     
     importance_df = pd.DataFrame({
-        'feature': feature_names,
-        'importance': analyzer.demand_model.feature_importances_
+        'feature': COLUMNAS_DEMANDA,
+        'importance': importancias
     }).sort_values('importance', ascending=False)
     
     return importance_df
 
+def _simular_escenario(data, scenario_params):
+    """
+    Predicción de demanda de un escenario (se ejecuta en un proceso de joblib)
+    
+    Args:
+        data (pd.DataFrame): Datos base del inventario (no se modifican)
+        scenario_params (dict): Parámetros del escenario
+        
+    Returns:
+        tuple: (predicciones, métricas)
+    """
+    # Columnas modificadas según escenario (el resto se comparte con los datos base)
+    ajustes = {}
+    
+    if 'demand_multiplier' in scenario_params:
+        ajustes['ventas_mes_actual'] = data['ventas_mes_actual'].to_numpy() * scenario_params['demand_multiplier']
+    
+    if 'price_change' in scenario_params:
+        ajustes['precio_venta'] = data['precio_venta'].to_numpy() * (1 + scenario_params['price_change'])
+    
+    # Crear nuevo analizador sobre los mismos datos, sin copiarlos; el paralelismo
+    # va por escenario, así que cada bosque entrena en un solo proceso
+    scenario_analyzer = InventoryMLAnalyzer(data, ajustes=ajustes)
+    scenario_analyzer.n_jobs = 1
+    return scenario_analyzer.predict_demand()
+
 def simulate_scenarios(analyzer, scenarios):
     """
-    Simular diferentes escenarios de demanda
+    Simular diferentes escenarios de demanda (en paralelo, un escenario por proceso)
     
     Args:
         analyzer (InventoryMLAnalyzer): Analizador ML
@@ -458,22 +677,17 @@ def simulate_scenarios(analyzer, scenarios):
     Returns:
         dict: Resultados de simulación
     """
+    from joblib import Parallel, delayed
+    
+    n_jobs = min(len(scenarios), trabajos_paralelos(len(analyzer.data))) or 1
+    salidas = Parallel(n_jobs=n_jobs, backend='loky')(
+        delayed(_simular_escenario)(analyzer.data, scenario_params)
+        for scenario_params in scenarios.values()
+    )
+    
     results = {}
     
-    for scenario_name, scenario_params in scenarios.items():
-        # Modificar datos según escenario
-        modified_data = analyzer.data.copy()
-        
-        if 'demand_multiplier' in scenario_params:
-            modified_data['ventas_mes_actual'] *= scenario_params['demand_multiplier']
-        
-        if 'price_change' in scenario_params:
-            modified_data['precio_venta'] *= (1 + scenario_params['price_change'])
-        
-        # Crear nuevo analizador con datos modificados
-        scenario_analyzer = InventoryMLAnalyzer(modified_data)
-        predictions, metrics = scenario_analyzer.predict_demand()
-        
+    for (scenario_name, scenario_params), (predictions, metrics) in zip(scenarios.items(), salidas):
         results[scenario_name] = {
             'predictions': predictions,
             'metrics': metrics,